@@ -1,4 +1,198 @@
+import csv
+import json
+import math
+import random
+from functools import lru_cache
+from string import Formatter
+from typing import Optional
+
 BWA_EXTNS = [".amb", ".ann", ".bwt", ".pac", ".sa"]
+# sourced by jobs to stage their inputs on node-local scratch
+STAGE = f"{SCRIPTS / 'stage.sh'} {STAGE_MAX_GB} {STAGE_DIR}".rstrip()
+# per-run file layouts, relative to RESULTS. {proj}, {sample} and {run} are filled from
+# the samplesheet columns, {tech} and {depth} from the arguments to run_paths
+RUN_PATH_TEMPLATES = {
+    "download_dir": "download/{tech}/{proj}/{sample}/{run}",
+    "qc_record": "filtered/{tech}/{proj}/{sample}/{run}/{run}.qc.json",
+    "mykrobe_report": "amr_predictions/mykrobe/{tech}/{proj}/{sample}/{run}.mykrobe.json.gz",
+    "drprg_report": "amr_predictions/drprg/{tech}/{proj}/{sample}/{run}/{run}.drprg.json",
+    "tbprofiler_report": "amr_predictions/tbprofiler/{tech}/{proj}/{sample}/{run}/results/{run}.results.json",
+    "mykrobe_depth_report": "depth/mykrobe/{depth}/{tech}/{proj}/{sample}/{run}.mykrobe.json.gz",
+    "drprg_depth_report": "depth/drprg/{depth}/{tech}/{proj}/{sample}/{run}/{run}.drprg.json",
+    "tbprofiler_depth_report": "depth/tbprofiler/{depth}/{tech}/{proj}/{sample}/{run}/results/{run}.results.json",
+}
+# the rules that run once per technology and have a benchmark
+TECH_BENCHMARK_RULES = (
+    "qc_summary",
+    *(f"combine_{tool}_reports" for tool in TOOLS),
+    *(f"combine_{tool}_depth_reports" for tool in TOOLS),
+    "aggregate_predict_benchmarks",
+    "compare_sn_and_sp",
+    "plot_sample_depth",
+    "plot_predict_benchmark",
+    "plot_phenotype_availability",
+)
+# benchmark file layouts, relative to RESULTS, for every rule with a benchmark directive
+# that aggregate_benchmarks collects. the per-run layouts are also run path templates,
+# as {rule}_benchmark
+BENCHMARK_TEMPLATES = {
+    "preprocessing": "benchmark/preprocessing/{tech}/{proj}/{sample}/{run}.tsv",
+    "map_to_decontam_db": "benchmark/map_to_decontam_db/{tech}/{proj}/{sample}/{run}.tsv",
+    "filter_contamination": "benchmark/filter_contamination/{tech}/{proj}/{sample}/{run}.tsv",
+    "extract_decontaminated_reads": "benchmark/extract_decontaminated_reads/{tech}/{proj}/{sample}/{run}.tsv",
+    "streaming_qc": "benchmark/streaming_qc/{tech}/{proj}/{sample}/{run}.tsv",
+    "map_and_filter_qc_batch": "benchmark/map_and_filter_qc_batch/{tech}/{batch}.tsv",
+    **{
+        f"{tool}_predict": f"benchmark/predict/{tool}/{{tech}}/{{proj}}/{{sample}}/{{run}}.tsv"
+        for tool in TOOLS
+    },
+    "drprg_predict_batch": "benchmark/drprg_predict_batch/{tech}/{batch}.tsv",
+    "subsample_depths": "benchmark/subsample_depths/{tech}/{proj}/{sample}/{run}.tsv",
+    **{
+        f"{tool}_depth": f"benchmark/{tool}_depth/{{depth}}/{{tech}}/{{proj}}/{{sample}}/{{run}}.tsv"
+        for tool in TOOLS
+    },
+    **{rule: f"benchmark/{rule}/{{tech}}.tsv" for rule in TECH_BENCHMARK_RULES},
+    "drprg_build": "benchmark/drprg_build/w{w}/k{k}.tsv",
+    # the per-bioproject partials and their merges, when PROJECT_PARTIALS is set
+    "combine_project_reports": "benchmark/combine_project_reports/{tool}/{tech}/{proj}.tsv",
+    "combine_project_depth_reports": "benchmark/combine_project_depth_reports/{tool}/{tech}/{proj}.tsv",
+    "aggregate_project_predict_benchmarks": "benchmark/aggregate_project_predict_benchmarks/{tech}/{proj}.tsv",
+    "merge_report_partials": "benchmark/merge_report_partials/{tool}/{tech}.tsv",
+    "merge_depth_report_partials": "benchmark/merge_depth_report_partials/{tool}/{tech}.tsv",
+    "merge_predict_benchmark_partials": "benchmark/merge_predict_benchmark_partials/{tech}.tsv",
+}
+# the rules replaced by a merge of per-bioproject partials when PROJECT_PARTIALS is set
+PARTIAL_RULES = {
+    *(f"combine_{tool}_reports" for tool in TOOLS),
+    *(f"combine_{tool}_depth_reports" for tool in TOOLS),
+    "aggregate_predict_benchmarks",
+}
+RUN_PATH_TEMPLATES.update(
+    {
+        f"{rule}_benchmark": template
+        for rule, template in BENCHMARK_TEMPLATES.items()
+        if "{run}" in template
+    }
+)
+
+
+# the columns run_paths needs to build per-run paths
+RUN_COLUMNS = ("bioproject", "biosample")
+# the phenotypes that determine whether a run is part of the depth analysis
+DEPTH_DRUGS = (
+    "delamanid",
+    "kanamycin",
+    "levofloxacin",
+    "ofloxacin",
+    "pyrazinamide",
+    "streptomycin",
+)
+
+
+@lru_cache(maxsize=None)
+def load_samplesheet(
+    tech: str, columns: Optional[tuple[str, ...]] = None
+) -> "pd.DataFrame":
+    """Load the samplesheet for a technology, indexed by run. Parsing is deferred until
+    an input function asks for it and then cached, so jobs that never evaluate those
+    input functions don't pay for it at startup. Only the given columns (all if None)
+    are read, from the compiled columnar store if it is up to date with the CSV.
+    """
+    import pandas as pd
+
+    csv = Path(config[f"{tech}_samplesheet"])
+    store = SAMPLESHEETS / f"{tech}.samplesheet.parquet"
+    usecols = None if columns is None else ["run", *columns]
+
+    if store.exists() and store.stat().st_mtime >= csv.stat().st_mtime:
+        df = pd.read_parquet(store, columns=usecols).set_index("run")
+        df.index = df.index.astype(str)
+    else:
+        df = pd.read_csv(csv, index_col="run", usecols=usecols, low_memory=False)
+
+    return df
+
+
+@lru_cache(maxsize=None)
+def load_depth_samplesheet(tech: str) -> "pd.DataFrame":
+    """The runs used in the depth analysis"""
+    if tech == "illumina":
+        df = load_samplesheet(tech, RUN_COLUMNS + DEPTH_DRUGS).query(
+            "(levofloxacin.notna() and streptomycin.notna() and kanamycin.isna() and ofloxacin.notna() and pyrazinamide.notna()) or (delamanid.notna() and pyrazinamide.notna() and levofloxacin.isna())"
+        )
+    else:
+        df = load_samplesheet(tech, RUN_COLUMNS)
+
+    return df
+
+
+@lru_cache(maxsize=None)
+def load_h2h_samplesheet() -> "pd.DataFrame":
+    import pandas as pd
+
+    return pd.read_csv(config["h2h_samplesheet"]).query(inclusion_expr)
+
+
+@lru_cache(maxsize=None)
+def run_paths(tech: str, kind: str, depth: Optional[int] = None) -> tuple[str, ...]:
+    """Build the path of the given kind for every run of a technology in one go.
+    The bioproject, biosample and run columns are concatenated column-wise rather than
+    row by row, and the result is memoised as Snakemake calls the input functions
+    using this many times during DAG construction. If depth is given, the runs are
+    taken from the depth analysis samplesheet.
+    """
+    import pandas as pd
+
+    if depth is None:
+        df = load_samplesheet(tech, RUN_COLUMNS)
+    else:
+        df = load_depth_samplesheet(tech)
+
+    columns = {
+        "proj": df["bioproject"].astype(str),
+        "sample": df["biosample"].astype(str),
+        "run": df.index.to_series().astype(str),
+    }
+    fixed = {"tech": tech, "depth": depth}
+
+    paths = pd.Series(f"{RESULTS}/", index=df.index)
+    for literal, field, _, _ in Formatter().parse(RUN_PATH_TEMPLATES[kind]):
+        paths += literal
+        if field is None:
+            continue
+        elif field in columns:
+            paths += columns[field]
+        else:
+            paths += str(fixed[field])
+
+    return tuple(paths)
+
+
+@lru_cache(maxsize=None)
+def project_run_paths(
+    tech: str, kind: str, depth: Optional[int] = None
+) -> dict[str, tuple[str, ...]]:
+    """The paths of run_paths, grouped by bioproject"""
+    if depth is None:
+        df = load_samplesheet(tech, RUN_COLUMNS)
+    else:
+        df = load_depth_samplesheet(tech)
+
+    groups = dict()
+    for proj, path in sorted(zip(df["bioproject"], run_paths(tech, kind, depth))):
+        groups.setdefault(proj, []).append(path)
+
+    return {proj: tuple(paths) for proj, paths in groups.items()}
+
+
+def depth_run_paths(tech: str, kind: str) -> list[str]:
+    """Paths of the given kind for every run of the depth analysis at every depth"""
+    files = []
+    for dp in config["depths"]:
+        files.extend(run_paths(tech, kind, dp))
+
+    return files
 
 
 def infer_h2h_reads(wildcards, tech=None):
@@ -20,47 +214,85 @@ def infer_h2h_reads(wildcards, tech=None):
         raise ValueError(f"Got unknown tech {tech}")
 
 
-def infer_mykrobe_tech_opts(wildcards):
-    return {"illumina": "", "nanopore": "--ont"}[wildcards.tech]
+def wk_reports(combos, samples) -> list[Path]:
+    return [
+        WK_SWEEP / f"predict/w{w}/k{k}/{tech}/{sample}/{sample}.drprg.json"
+        for (w, k), sample, tech in product(combos, samples, TECHS)
+    ]
 
 
-def infer_mykrobe_reports(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
+@lru_cache(maxsize=None)
+def wk_sweep_samples() -> tuple[str, ...]:
+    """The h2h samples in a random order fixed by the seed. Each round of the adaptive
+    sweep takes a prefix of this, so a round's samples include those of the rounds
+    before it, and their predictions are reused"""
+    samples = sorted(load_h2h_samplesheet()["sample"])
+    random.Random(WK_SWEEP_CONFIG.get("seed", 88)).shuffle(samples)
+    return tuple(samples)
 
-    files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
-        p = (
-            RESULTS
-            / f"amr_predictions/mykrobe/{wildcards.tech}/{proj}/{sample}/{run}.mykrobe.json.gz"
-        )
-        files.append(p)
 
-    return files
+@lru_cache(maxsize=None)
+def wk_sweep_rounds() -> int:
+    """The number of rounds of successive halving before the remaining combinations are
+    evaluated on every sample. The rounds end once a round would use every sample, or a
+    single combination is left"""
+    eta = WK_SWEEP_CONFIG.get("eta", 3)
+    min_samples = WK_SWEEP_CONFIG.get("min_samples", 10)
+    n_samples = len(wk_sweep_samples())
+    n_combos = len(WKS)
+    rounds = 0
+    while min_samples * eta**rounds < n_samples and n_combos > 1:
+        n_combos = math.ceil(n_combos / eta)
+        rounds += 1
 
+    return rounds
 
-def infer_mykrobe_depth_reports(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_depth_df
-    else:
-        df = ont_df
 
-    files = []
-    for dp in config["depths"]:
-        for run, row in df.iterrows():
-            proj = row["bioproject"]
-            sample = row["biosample"]
-            p = (
-                RESULTS
-                / f"depth/mykrobe/{dp}/{wildcards.tech}/{proj}/{sample}/{run}.mykrobe.json.gz"
-            )
-            files.append(p)
+def wk_round_samples(rnd: int) -> tuple[str, ...]:
+    if rnd >= wk_sweep_rounds():
+        return wk_sweep_samples()
 
-    return files
+    min_samples = WK_SWEEP_CONFIG.get("min_samples", 10)
+    return wk_sweep_samples()[: min_samples * WK_SWEEP_CONFIG.get("eta", 3) ** rnd]
+
+
+def wk_round_combos(rnd: int) -> list[tuple[int, int]]:
+    """The combinations evaluated in a round - those advanced by the previous round"""
+    if rnd == 0:
+        return WKS
+
+    scores = checkpoints.wk_sweep_round.get(round=rnd - 1).output.scores
+    with open(scores) as fp:
+        return [
+            (int(row["w"]), int(row["k"]))
+            for row in csv.DictReader(fp)
+            if row["advance"] == "True"
+        ]
+
+
+def infer_wk_round_reports(wildcards):
+    rnd = int(wildcards.round)
+    return wk_reports(wk_round_combos(rnd), wk_round_samples(rnd))
+
+
+def infer_wk_reports(wildcards):
+    samples = load_h2h_samplesheet()["sample"]
+    if not ADAPTIVE_WK_SWEEP:
+        return wk_reports(WKS, samples)
+
+    return wk_reports(wk_round_combos(wk_sweep_rounds()), samples)
+
+
+def infer_mykrobe_tech_opts(wildcards):
+    return {"illumina": "", "nanopore": "--ont"}[wildcards.tech]
+
+
+def infer_mykrobe_reports(wildcards):
+    return list(run_paths(wildcards.tech, "mykrobe_report"))
+
+
+def infer_mykrobe_depth_reports(wildcards):
+    return depth_run_paths(wildcards.tech, "mykrobe_depth_report")
 
 
 def infer_drprg_tech_opts(wildcards, override_depth=None) -> str:
@@ -89,6 +321,13 @@ def infer_preprocessing_tech_opts(wildcards) -> str:
     ]
 
 
+def infer_streaming_preprocessing_opts(wildcards) -> str:
+    """The preprocessing options without the -I flag, which streaming_qc.sh takes from
+    the mapping options instead"""
+    opts = infer_preprocessing_tech_opts(wildcards).split()
+    return " ".join(opt for opt in opts if opt != "-I")
+
+
 def infer_map_opts(wildcards):
     return {"illumina": "-I -M", "nanopore": "-a -x map-ont"}[wildcards.tech]
 
@@ -98,90 +337,91 @@ def infer_map_ref_index(wildcards, input) -> str:
 
 
 def infer_download_dirs(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
+    return list(run_paths(wildcards.tech, "download_dir"))
 
-    dirs = []
-    for run, row in df.iterrows():
-        p = (
-            RESULTS
-            / f"download/{wildcards.tech}/{row.bioproject}/{row.biosample}/{run}"
-        )
-        dirs.append(p)
 
-    return dirs
+@lru_cache(maxsize=None)
+def qc_batches(tech: str) -> list["pd.DataFrame"]:
+    """Split the runs of a technology into chunks of QC_BATCH_SIZE. Runs are sorted so
+    the batches don't depend on the order of the samplesheet.
+    """
+    df = load_samplesheet(tech, RUN_COLUMNS).sort_index()
+    return [df.iloc[i : i + QC_BATCH_SIZE] for i in range(0, len(df), QC_BATCH_SIZE)]
 
 
-def infer_stats_files(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
+@lru_cache(maxsize=None)
+def qc_batch_lookup(tech: str) -> dict[str, int]:
+    """Map each run to the index of the QC batch it belongs to"""
+    return {run: i for i, batch in enumerate(qc_batches(tech)) for run in batch.index}
 
-    files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
-        p = (
-            RESULTS
-            / f"filtered/{wildcards.tech}/{proj}/{sample}/{run}/{run}.filtered.stats.tsv"
-        )
-        files.append(str(p))
 
-    return files
+def infer_qc_batch_dir(wildcards):
+    batch = qc_batch_lookup(wildcards.tech)[wildcards.run]
+    return RESULTS / f"qc_batches/{wildcards.tech}/{batch}"
 
 
-def infer_keep_files(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
+def infer_qc_batch_runs(wildcards) -> list[tuple[str, Path, Path]]:
+    """The run accession, preprocessed reads and run info file for each run in a batch"""
+    tech = wildcards.tech
+    batch = qc_batches(tech)[int(wildcards.batch)]
+    runs = []
+    for run, proj, sample in zip(batch.index, batch["bioproject"], batch["biosample"]):
+        reads = RESULTS / f"preprocessing/{tech}/{proj}/{sample}/{run}.fq.gz"
+        run_info = RESULTS / f"validate/{tech}/{proj}/{sample}/{run}/run_info.tsv"
+        runs.append((run, reads, run_info))
 
-    files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
-        p = RESULTS / f"filtered/{wildcards.tech}/{proj}/{sample}/{run}/keep.reads"
-        files.append(str(p))
+    return runs
 
-    return files
 
+@lru_cache(maxsize=None)
+def qc_record_shards(tech: str) -> dict[str, tuple[str, ...]]:
+    """The QC record of each run, grouped by bioproject"""
+    return project_run_paths(tech, "qc_record")
 
-def infer_contam_files(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
 
-    files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
-        p = (
-            RESULTS
-            / f"filtered/{wildcards.tech}/{proj}/{sample}/{run}/contaminant.reads"
-        )
-        files.append(str(p))
+def infer_qc_records(wildcards):
+    return list(qc_record_shards(wildcards.tech)[wildcards.proj])
 
-    return files
 
+def infer_qc_record_shards(wildcards):
+    return [
+        RESULTS / f"QC/records/{wildcards.tech}/{proj}.jsonl"
+        for proj in qc_record_shards(wildcards.tech)
+    ]
 
-def infer_unmapped_files(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
 
-    files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
-        p = RESULTS / f"filtered/{wildcards.tech}/{proj}/{sample}/{run}/unmapped.reads"
-        files.append(str(p))
+@lru_cache(maxsize=None)
+def drprg_batches(tech: str) -> list["pd.DataFrame"]:
+    """Split the runs of a technology into chunks of DRPRG_BATCH_SIZE. Runs are sorted
+    so the batches don't depend on the order of the samplesheet.
+    """
+    df = load_samplesheet(tech, RUN_COLUMNS).sort_index()
+    return [
+        df.iloc[i : i + DRPRG_BATCH_SIZE] for i in range(0, len(df), DRPRG_BATCH_SIZE)
+    ]
 
-    return files
+
+@lru_cache(maxsize=None)
+def drprg_batch_lookup(tech: str) -> dict[str, int]:
+    """Map each run to the index of the drprg batch it belongs to"""
+    return {run: i for i, batch in enumerate(drprg_batches(tech)) for run in batch.index}
+
+
+def infer_drprg_batch_dir(wildcards):
+    batch = drprg_batch_lookup(wildcards.tech)[wildcards.run]
+    return RESULTS / f"drprg_batches/{wildcards.tech}/{batch}"
+
+
+def infer_drprg_batch_runs(wildcards) -> list[tuple[str, Path]]:
+    """The run accession and decontaminated reads for each run in a batch"""
+    tech = wildcards.tech
+    batch = drprg_batches(tech)[int(wildcards.batch)]
+    runs = []
+    for run, proj, sample in zip(batch.index, batch["bioproject"], batch["biosample"]):
+        reads = RESULTS / f"filtered/{tech}/{proj}/{sample}/{run}/{run}.filtered.fq.gz"
+        runs.append((run, reads))
+
+    return runs
 
 
 def drprg_filter_args(wildcards, override_depth: int = None) -> str:
@@ -212,95 +452,195 @@ def drprg_filter_args(wildcards, override_depth: int = None) -> str:
 
 
 def infer_drprg_reports(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
+    return list(run_paths(wildcards.tech, "drprg_report"))
 
-    files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
-        p = (
-            RESULTS
-            / f"amr_predictions/drprg/{wildcards.tech}/{proj}/{sample}/{run}/{run}.drprg.json"
-        )
-        files.append(p)
 
-    return files
+def infer_drprg_depth_reports(wildcards):
+    return depth_run_paths(wildcards.tech, "drprg_depth_report")
 
 
-def infer_drprg_depth_reports(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_depth_df
-    else:
-        df = ont_df
+def infer_tbprofiler_reports(wildcards):
+    return list(run_paths(wildcards.tech, "tbprofiler_report"))
+
+
+def infer_tbprofiler_depth_reports(wildcards):
+    return depth_run_paths(wildcards.tech, "tbprofiler_depth_report")
 
+
+def infer_project_reports(wildcards):
+    return list(
+        project_run_paths(wildcards.tech, f"{wildcards.tool}_report")[wildcards.proj]
+    )
+
+
+def infer_project_depth_reports(wildcards):
     files = []
     for dp in config["depths"]:
-        for run, row in df.iterrows():
-            proj = row["bioproject"]
-            sample = row["biosample"]
-            p = (
-                RESULTS
-                / f"depth/drprg/{dp}/{wildcards.tech}/{proj}/{sample}/{run}/{run}.drprg.json"
-            )
-            files.append(p)
+        runs = project_run_paths(wildcards.tech, f"{wildcards.tool}_depth_report", dp)
+        files.extend(runs[wildcards.proj])
 
     return files
 
 
-def infer_tbprofiler_reports(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
-    else:
-        df = ont_df
-
+def infer_project_benchmark_reports(wildcards):
     files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
-        p = (
-            RESULTS
-            / f"amr_predictions/tbprofiler/{wildcards.tech}/{proj}/{sample}/{run}/results/{run}.results.json"
-        )
-        files.append(p)
+    for tool in TOOLS:
+        runs = project_run_paths(wildcards.tech, f"{tool}_predict_benchmark")
+        files.extend(runs[wildcards.proj])
 
     return files
 
 
-def infer_tbprofiler_depth_reports(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_depth_df
-    else:
-        df = ont_df
+def infer_report_partials(wildcards):
+    tech = wildcards.tech
+    return [
+        RESULTS / f"amr_predictions/{wildcards.tool}/{tech}/partials/{proj}.csv"
+        for proj in project_run_paths(tech, "qc_record")
+    ]
 
+
+def infer_depth_report_partials(wildcards):
+    tech = wildcards.tech
+    # any depth gives the bioprojects of the depth analysis
+    projects = project_run_paths(tech, "qc_record", config["depths"][0])
+    return [
+        RESULTS / f"depth/{wildcards.tool}/{tech}/partials/{proj}.csv"
+        for proj in projects
+    ]
+
+
+def infer_benchmark_partials(wildcards):
+    return [
+        BENCH / f"predict/partials/{wildcards.tech}/{proj}.csv"
+        for proj in project_run_paths(wildcards.tech, "qc_record")
+    ]
+
+
+def infer_all_benchmark_reports(wildcards):
     files = []
-    for dp in config["depths"]:
-        for run, row in df.iterrows():
-            proj = row["bioproject"]
-            sample = row["biosample"]
-            p = (
-                RESULTS
-                / f"depth/tbprofiler/{dp}/{wildcards.tech}/{proj}/{sample}/{run}/results/{run}.results.json"
-            )
-            files.append(p)
+    for tech in TECHS:
+        for tool in TOOLS:
+            files.extend(run_paths(tech, f"{tool}_predict_benchmark"))
 
     return files
 
 
 def infer_benchmark_reports(wildcards):
-    if wildcards.tech == "illumina":
-        df = illumina_df
+    files = []
+    for tool in TOOLS:
+        files.extend(run_paths(wildcards.tech, f"{tool}_predict_benchmark"))
+
+    return files
+
+
+def infer_pipeline_benchmarks(wildcards):
+    """The benchmarks of every rule that runs for a technology, given how the QC and
+    drprg predictions are configured to run"""
+    tech = wildcards.tech
+    if STREAMING_QC:
+        run_rules = ["streaming_qc"]
+    elif QC_BATCH_SIZE > 1:
+        run_rules = ["preprocessing", "extract_decontaminated_reads"]
     else:
-        df = ont_df
+        run_rules = [
+            "preprocessing",
+            "map_to_decontam_db",
+            "filter_contamination",
+            "extract_decontaminated_reads",
+        ]
+    run_rules.extend(f"{tool}_predict" for tool in TOOLS)
 
     files = []
-    for run, row in df.iterrows():
-        proj = row["bioproject"]
-        sample = row["biosample"]
+    for rule in run_rules:
+        files.extend(run_paths(tech, f"{rule}_benchmark"))
+
+    # any depth selects the runs of the depth analysis
+    files.extend(
+        run_paths(tech, "subsample_depths_benchmark", config["depths"][0])
+    )
+    for tool in TOOLS:
+        files.extend(depth_run_paths(tech, f"{tool}_depth_benchmark"))
+
+    batched_rules = []
+    if QC_BATCH_SIZE > 1 and not STREAMING_QC:
+        batched_rules.append(("map_and_filter_qc_batch", qc_batches(tech)))
+    if DRPRG_BATCH_SIZE > 1:
+        batched_rules.append(("drprg_predict_batch", drprg_batches(tech)))
+    for rule, batches in batched_rules:
+        template = BENCHMARK_TEMPLATES[rule]
+        files.extend(
+            RESULTS / template.format(tech=tech, batch=i) for i in range(len(batches))
+        )
+
+    for rule in TECH_BENCHMARK_RULES:
+        if not (PROJECT_PARTIALS and rule in PARTIAL_RULES):
+            files.append(RESULTS / BENCHMARK_TEMPLATES[rule].format(tech=tech))
+
+    if PROJECT_PARTIALS:
+        projects = project_run_paths(tech, "qc_record")
+        depth_projects = project_run_paths(tech, "qc_record", config["depths"][0])
+        partials = [
+            ("combine_project_reports", "merge_report_partials", projects),
+            ("combine_project_depth_reports", "merge_depth_report_partials", depth_projects),
+        ]
         for tool in TOOLS:
-            p = BENCH / f"predict/{tool}/{wildcards.tech}/{proj}/{sample}/{run}.tsv"
-            files.append(p)
+            for partial_rule, merge_rule, projs in partials:
+                files.extend(
+                    RESULTS
+                    / BENCHMARK_TEMPLATES[partial_rule].format(
+                        tool=tool, tech=tech, proj=proj
+                    )
+                    for proj in projs
+                )
+                files.append(
+                    RESULTS / BENCHMARK_TEMPLATES[merge_rule].format(tool=tool, tech=tech)
+                )
+        files.extend(
+            RESULTS
+            / BENCHMARK_TEMPLATES["aggregate_project_predict_benchmarks"].format(
+                tech=tech, proj=proj
+            )
+            for proj in projects
+        )
+        files.append(
+            RESULTS
+            / BENCHMARK_TEMPLATES["merge_predict_benchmark_partials"].format(tech=tech)
+        )
+
+    files.append(RESULTS / BENCHMARK_TEMPLATES["drprg_build"].format(w=W, k=K))
 
     return files
+
+
+@lru_cache(maxsize=None)
+def load_resource_model() -> dict:
+    """The resource model fitted by fit_resource_model, if fitted resources are turned
+    on and it has been fitted"""
+    if not FITTED_RESOURCES or not RESOURCE_MODEL.exists():
+        return dict()
+
+    return json.loads(RESOURCE_MODEL.read_text())
+
+
+def fitted_resource(tool: str, kind: str, default):
+    """A resource function for a per-run rule of a tool. The value is predicted from the
+    size of the job's reads if the model has a fit for the tool and tech, otherwise (or
+    if the reads don't exist yet) the default - an int or a function of the attempt -
+    is used. Memory and runtime predictions are scaled by the attempt, so a job that
+    fails gets more on its retry"""
+
+    def resource(wildcards, input, attempt):
+        fit = load_resource_model().get(tool, {}).get(wildcards.tech, {}).get(kind)
+        reads = Path(input.reads)
+        if fit is None or not reads.exists():
+            return default(attempt) if callable(default) else default
+
+        if kind == "threads":
+            return fit["value"]
+
+        size = reads.stat().st_size / (1_024 * 1_024)
+        value = fit["intercept"] + fit["slope"] * size + fit["margin"]
+        floor = {"mem_mb": int(0.5 * GB), "runtime": 1}[kind]
+        return attempt * max(floor, math.ceil(value))
+
+    return resource
@@ -1,19 +1,57 @@
+SUBSAMPLE_SELECTION = (
+    RESULTS / "depth/selections/{tech}/{proj}/{sample}/{run}/{run}.{depth}x.bitmap.gz"
+)
+
+
+rule subsample_depths:
+    """Subsample a run to every depth in a single pass, shared by every depth tool. The
+    selections are kept, so rerunning a predictor only has to extract its reads. The
+    reads (pairs) are taken in the same random order for every depth, so each depth is a
+    subset of the larger ones"""
+    input:
+        reads=FILTERED_READS,
+    output:
+        selections=expand(
+            SUBSAMPLE_SELECTION, depth=config["depths"], allow_missing=True
+        ),
+    log:
+        LOGS / "subsample_depths/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "subsample_depths/{tech}/{proj}/{sample}/{run}.tsv"
+    resources:
+        mem_mb=lambda wildcards, attempt: attempt * int(2 * GB),
+    params:
+        seed=88,
+        genome_size=config["genome_size"],
+        depths=config["depths"],
+        script=SCRIPTS / "subsample.py",
+    container:
+        CONTAINERS["python"]
+    shell:
+        """
+        python {params.script} select -i {input.reads} -c {params.depths} \
+            -g {params.genome_size} -s {params.seed} -o {output.selections} 2> {log}
+        """
+
+
 rule mykrobe_depth:
     input:
-        reads=rules.extract_decontaminated_reads.output.reads,
-        run_info=rules.validate_run_info.output.run_info,
+        reads=FILTERED_READS,
+        selection=SUBSAMPLE_SELECTION,
     output:
         report=RESULTS
         / "depth/mykrobe/{depth}/{tech}/{proj}/{sample}/{run}.mykrobe.json.gz",
     log:
         LOGS / "mykrobe_depth/{depth}/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "mykrobe_depth/{depth}/{tech}/{proj}/{sample}/{run}.tsv"
     shadow:
         "shallow"
     resources:
         mem_mb=int(4 * GB),
     params:
-        seed=88,
-        genome_size=config["genome_size"],
+        subsampler=rules.subsample_depths.params.script,
+        stage=STAGE,
         mykrobe_opts=rules.mykrobe_predict.params.opts,
         tech_opts=infer_mykrobe_tech_opts,
     conda:
@@ -27,17 +65,28 @@ rule combine_mykrobe_depth_reports:
         reports=infer_mykrobe_depth_reports,
     output:
         report=RESULTS / "depth/mykrobe/{tech}.summary.csv",
+        dataset=directory(
+            RESULTS / "depth/summary.parquet/tool=mykrobe/technology={tech}"
+        ),
     log:
         LOGS / "combine_mykrobe_reports/{tech}.log",
-    container:
-        CONTAINERS["python"]
+    benchmark:
+        BENCH / "combine_mykrobe_depth_reports/{tech}.tsv"
+    threads: 8
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool="mykrobe",
+        depth=True,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
     script:
-        str(SCRIPTS / "combine_mykrobe_depth_reports.py")
+        str(SCRIPTS / "combine_reports.py")
 
 
 rule tbprofiler_depth:
     input:
-        reads=rules.extract_decontaminated_reads.output.reads,
+        reads=FILTERED_READS,
+        selection=SUBSAMPLE_SELECTION,
         run_info=rules.validate_run_info.output.run_info,
         db=rules.create_tbprofiler_db.output[0],
     output:
@@ -47,6 +96,8 @@ rule tbprofiler_depth:
         / "depth/tbprofiler/{depth}/{tech}/{proj}/{sample}/{run}/vcf/{run}.targets.csq.vcf.gz",
     log:
         LOGS / "tbprofiler_depth/{depth}/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "tbprofiler_depth/{depth}/{tech}/{proj}/{sample}/{run}.tsv"
     shadow:
         "shallow"
     threads: 2
@@ -58,8 +109,8 @@ rule tbprofiler_depth:
         opts="--txt --no_trim -p {run}",
         min_depth=lambda wildcards: 10 if int(wildcards.depth) > 20 else 1,
         outdir=lambda wildcards, output: Path(output.report).parent.parent,
-        seed=rules.mykrobe_depth.params.seed,
-        genome_size=rules.mykrobe_depth.params.genome_size,
+        subsampler=rules.subsample_depths.params.script,
+        stage=STAGE,
     script:
         SCRIPTS / "tbprofiler_depth.sh"
 
@@ -69,19 +120,29 @@ rule combine_tbprofiler_depth_reports:
         reports=infer_tbprofiler_depth_reports,
     output:
         report=RESULTS / "depth/tbprofiler/{tech}.summary.csv",
+        dataset=directory(
+            RESULTS / "depth/summary.parquet/tool=tbprofiler/technology={tech}"
+        ),
     log:
         LOGS / "combine_tbprofiler_reports/{tech}.log",
-    container:
-        CONTAINERS["python"]
+    benchmark:
+        BENCH / "combine_tbprofiler_depth_reports/{tech}.tsv"
+    threads: 8
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool="tbprofiler",
+        depth=True,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
     script:
-        str(SCRIPTS / "combine_tbprofiler_depth_reports.py")
+        str(SCRIPTS / "combine_reports.py")
 
 
 rule drprg_depth:
     input:
-        reads=rules.extract_decontaminated_reads.output.reads,
+        reads=FILTERED_READS,
+        selection=SUBSAMPLE_SELECTION,
         index=RESULTS / f"drprg/index/w{W}/k{K}",
-        run_info=rules.validate_run_info.output.run_info,
     output:
         report=RESULTS
         / "depth/drprg/{depth}/{tech}/{proj}/{sample}/{run}/{run}.drprg.json",
@@ -94,6 +155,8 @@ rule drprg_depth:
         CONTAINERS["drprg"]
     log:
         LOGS / "drprg_depth/{depth}/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "drprg_depth/{depth}/{tech}/{proj}/{sample}/{run}.tsv"
     params:
         opts=" ".join(
             [
@@ -105,8 +168,8 @@ rule drprg_depth:
         tech_opts=infer_drprg_tech_opts,
         filters=lambda wildcards: drprg_filter_args(wildcards, None if int(wildcards.depth) > 20 else 1),
         outdir=lambda wildcards, output: Path(output.report).parent,
-        seed=rules.mykrobe_depth.params.seed,
-        genome_size=rules.mykrobe_depth.params.genome_size,
+        subsampler=rules.subsample_depths.params.script,
+        stage=STAGE,
     threads: 2
     script:
         SCRIPTS / "drprg_depth.sh"
@@ -117,9 +180,82 @@ rule combine_drprg_depth_reports:
         reports=infer_drprg_depth_reports,
     output:
         report=RESULTS / "depth/drprg/{tech}.summary.csv",
+        dataset=directory(
+            RESULTS / "depth/summary.parquet/tool=drprg/technology={tech}"
+        ),
     log:
         LOGS / "combine_drprg_depth_reports/{tech}.log",
-    container:
-        CONTAINERS["python"]
+    benchmark:
+        BENCH / "combine_drprg_depth_reports/{tech}.tsv"
+    threads: 8
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool="drprg",
+        depth=True,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
     script:
-        str(SCRIPTS / "combine_drprg_depth_reports.py")
+        str(SCRIPTS / "combine_reports.py")
+
+
+rule combine_project_depth_reports:
+    """The depth summary of a tool's predictions for the runs of a single bioproject.
+    The partials are merged into the technology's summary by merge_depth_report_partials
+    """
+    input:
+        reports=infer_project_depth_reports,
+    output:
+        report=RESULTS / "depth/{tool}/{tech}/partials/{proj}.csv",
+    log:
+        LOGS / "combine_project_depth_reports/{tool}/{tech}/{proj}.log",
+    benchmark:
+        BENCH / "combine_project_depth_reports/{tool}/{tech}/{proj}.tsv"
+    wildcard_constraints:
+        tool="|".join(TOOLS),
+        tech="|".join(TECHS),
+    threads: 2
+    resources:
+        mem_mb=GB,
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool=lambda wildcards: wildcards.tool,
+        depth=True,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
+    script:
+        str(SCRIPTS / "combine_reports.py")
+
+
+rule merge_depth_report_partials:
+    input:
+        partials=infer_depth_report_partials,
+    output:
+        report=RESULTS / "depth/{tool}/{tech}.summary.csv",
+        dataset=directory(
+            RESULTS / "depth/summary.parquet/tool={tool}/technology={tech}"
+        ),
+    log:
+        LOGS / "merge_depth_report_partials/{tool}/{tech}.log",
+    benchmark:
+        BENCH / "merge_depth_report_partials/{tool}/{tech}.tsv"
+    wildcard_constraints:
+        tool="|".join(TOOLS),
+        tech="|".join(TECHS),
+    resources:
+        mem_mb=GB,
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        partition_key="depth",
+    script:
+        str(SCRIPTS / "merge_partials.py")
+
+
+if PROJECT_PARTIALS:
+
+    ruleorder: merge_depth_report_partials > combine_mykrobe_depth_reports > combine_drprg_depth_reports > combine_tbprofiler_depth_reports
+
+
+else:
+
+    ruleorder: combine_mykrobe_depth_reports > combine_drprg_depth_reports > combine_tbprofiler_depth_reports > merge_depth_report_partials
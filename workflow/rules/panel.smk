@@ -231,6 +231,8 @@ rule drprg_build:
         ref=RESULTS / "drprg/index/w{w}/k{k}/genes.fa",
     log:
         LOGS / "drprg_build/w{w}/k{k}.log",
+    benchmark:
+        BENCH / "drprg_build/w{w}/k{k}.tsv"
     resources:
         mem_mb=lambda wildcards, attempt: attempt * int(4 * GB),
     threads: 2
@@ -240,12 +242,9 @@ rule drprg_build:
         options="-v -w {w} -k {k}",
         match_len=config["match_len"],
         padding=config["padding"],
-    shell:
-        """
-        drprg build {params.options} -l {params.match_len} -P {params.padding} \
-            -a {input.annotation} -o {output.outdir} -i {input.panel} \
-            -f {input.ref} -t {threads} -b {input.vcf} -r {input.rules} 2> {log}
-        """
+        cache=DRPRG_INDEX_CACHE,
+    script:
+        str(SCRIPTS / "drprg_build.sh")
 
 
 rule download_tbprofiler_db:
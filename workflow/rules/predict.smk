@@ -2,14 +2,15 @@
 
 rule mykrobe_predict:
     input:
-        reads=rules.extract_decontaminated_reads.output.reads,
+        reads=FILTERED_READS,
     output:
         report=RESULTS
         / "amr_predictions/mykrobe/{tech}/{proj}/{sample}/{run}.mykrobe.json.gz",
     shadow:
         "shallow"
     resources:
-        mem_mb=lambda wildcards, attempt: attempt * 4 * GB,
+        mem_mb=fitted_resource("mykrobe", "mem_mb", lambda attempt: attempt * 4 * GB),
+        runtime=fitted_resource("mykrobe", "runtime", None),
     container:
         CONTAINERS["mykrobe"]
     log:
@@ -28,11 +29,15 @@ rule mykrobe_predict:
         ),
         tech_opts=infer_mykrobe_tech_opts,
         base_json=lambda wildcards, output: Path(output.report).with_suffix(""),
-    threads: 2
+        stage=STAGE,
+    threads: fitted_resource("mykrobe", "threads", 2)
     shell:
         """
+        source {params.stage}
+        stage {input.reads} reads 2> {log}
+
         mykrobe predict {params.tech_opts} {params.opts} -o {params.base_json} \
-            -i {input.reads} -t {threads} -m {resources.mem_mb}MB > {log} 2>&1
+            -i "$reads" -t {threads} -m {resources.mem_mb}MB >> {log} 2>&1
         gzip {params.base_json} 2>> {log}
         """
 
@@ -42,15 +47,24 @@ rule combine_mykrobe_reports:
         reports=infer_mykrobe_reports,
     output:
         report=RESULTS / "amr_predictions/mykrobe/{tech}/summary.csv",
+        dataset=directory(
+            RESULTS / "amr_predictions/summary.parquet/tool=mykrobe/technology={tech}"
+        ),
     log:
         LOGS / "combine_mykrobe_reports/{tech}.log",
-    threads: 16
+    benchmark:
+        BENCH / "combine_mykrobe_reports/{tech}.tsv"
+    threads: 8
     resources:
-        mem_mb=int(16*GB),
-    container:
-        CONTAINERS["python"]
+        mem_mb=int(2 * GB),
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool="mykrobe",
+        depth=False,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
     script:
-        str(SCRIPTS / "combine_mykrobe_reports.py")
+        str(SCRIPTS / "combine_reports.py")
 
 
 # ==========
@@ -58,7 +72,7 @@ rule combine_mykrobe_reports:
 # ==========
 rule drprg_predict:
     input:
-        reads=rules.extract_decontaminated_reads.output.reads,
+        reads=FILTERED_READS,
         index=RESULTS / f"drprg/index/w{W}/k{K}",
     output:
         report=RESULTS / "amr_predictions/drprg/{tech}/{proj}/{sample}/{run}/{run}.drprg.json",
@@ -67,7 +81,8 @@ rule drprg_predict:
     shadow:
         "shallow"
     resources:
-        mem_mb=lambda wildcards, attempt: attempt * 4 * GB,
+        mem_mb=fitted_resource("drprg", "mem_mb", lambda attempt: attempt * 4 * GB),
+        runtime=fitted_resource("drprg", "runtime", None),
     container:
         CONTAINERS["drprg"]
     benchmark:
@@ -84,11 +99,81 @@ rule drprg_predict:
         ),
         tech_opts=infer_drprg_tech_opts,
         filters=drprg_filter_args,
-    threads: 2
+        stage=STAGE,
+    threads: fitted_resource("drprg", "threads", 2)
     shell:
         """
+        source {params.stage}
+        stage {input.reads} reads 2> {log}
+        stage {input.index} index 2>> {log}
+
         drprg predict {params.opts} {params.tech_opts} {params.filters} \
-            -i {input.reads} -o {output.outdir} -x {input.index} -t {threads} 2> {log}
+            -i "$reads" -o {output.outdir} -x "$index" -t {threads} 2>> {log}
+        """
+
+
+rule drprg_predict_batch:
+    """Predict resistance for a batch of runs with drprg in a single job. The index is
+    copied to local disk once for the whole batch and each run's output directory,
+    log, and benchmark are written to a subdirectory of the output named after the run.
+    """
+    input:
+        index=rules.drprg_predict.input.index,
+        reads=lambda wildcards: [reads for _, reads in infer_drprg_batch_runs(wildcards)],
+    output:
+        outdir=temp(directory(RESULTS / "drprg_batches/{tech}/{batch}")),
+    wildcard_constraints:
+        batch=r"\d+",
+    resources:
+        mem_mb=lambda wildcards, attempt: attempt * 4 * GB,
+    container:
+        CONTAINERS["drprg"]
+    log:
+        LOGS / "drprg_predict_batch/{tech}/{batch}.log",
+    benchmark:
+        BENCH / "drprg_predict_batch/{tech}/{batch}.tsv"
+    params:
+        opts=" ".join(
+            [
+                "--verbose",
+                "--ignore-synonymous",
+            ]
+        ),
+        tech_opts=rules.drprg_predict.params.tech_opts,
+        filters=rules.drprg_predict.params.filters,
+        script=SCRIPTS / "drprg_batch.sh",
+        stage=STAGE,
+        runs=lambda wildcards: " ".join(
+            ",".join(map(str, entry)) for entry in infer_drprg_batch_runs(wildcards)
+        ),
+    threads: 2
+    shell:
+        """
+        bash {params.script} -x {input.index} -o {output.outdir} -t {threads} \
+            -p "{params.opts} {params.tech_opts} {params.filters}" -s "{params.stage}" \
+            {params.runs} 2> {log}
+        """
+
+
+rule unpack_drprg_batch:
+    input:
+        batch=infer_drprg_batch_dir,
+    output:
+        report=rules.drprg_predict.output.report,
+        vcf=rules.drprg_predict.output.vcf,
+        outdir=rules.drprg_predict.output.outdir,
+        benchmark=BENCH / "predict/drprg/{tech}/{proj}/{sample}/{run}.tsv",
+    resources:
+        mem_mb=int(0.5 * GB),
+    log:
+        LOGS / "drprg_predict/{tech}/{proj}/{sample}/{run}.log",
+    params:
+        indir=lambda wildcards, input: Path(input.batch) / wildcards.run,
+    shell:
+        """
+        cp -r {params.indir}/drprg/. {output.outdir}/ 2> {log}
+        cp {params.indir}/benchmark.tsv {output.benchmark} 2>> {log}
+        cat {params.indir}/drprg.log >> {log}
         """
 
 
@@ -97,14 +182,24 @@ rule combine_drprg_reports:
         reports=infer_drprg_reports,
     output:
         report=RESULTS / "amr_predictions/drprg/{tech}/summary.csv",
+        dataset=directory(
+            RESULTS / "amr_predictions/summary.parquet/tool=drprg/technology={tech}"
+        ),
     log:
         LOGS / "combine_drprg_reports/{tech}.log",
+    benchmark:
+        BENCH / "combine_drprg_reports/{tech}.tsv"
     resources:
         mem_mb=GB,
-    container:
-        CONTAINERS["python"]
+    threads: 8
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool="drprg",
+        depth=False,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
     script:
-        str(SCRIPTS / "combine_drprg_reports.py")
+        str(SCRIPTS / "combine_reports.py")
 
 
 # ==========
@@ -112,7 +207,7 @@ rule combine_drprg_reports:
 # ==========
 rule tbprofiler_predict:
     input:
-        reads=rules.extract_decontaminated_reads.output.reads,
+        reads=FILTERED_READS,
         run_info=rules.validate_run_info.output.run_info,
         db=rules.create_tbprofiler_db.output[0],
     output:
@@ -122,40 +217,22 @@ rule tbprofiler_predict:
         LOGS / "tbprofiler_predict/{tech}/{proj}/{sample}/{run}.log",
     shadow:
         "shallow"
-    threads: 2
+    threads: fitted_resource("tbprofiler", "threads", 2)
     resources:
-        mem_mb=lambda wildcards, attempt: attempt * int(6 * GB),
+        mem_mb=fitted_resource(
+            "tbprofiler", "mem_mb", lambda attempt: attempt * int(6 * GB)
+        ),
+        runtime=fitted_resource("tbprofiler", "runtime", None),
     conda:
         str(ENVS / "tbprofiler.yaml")
     params:
         opts="--txt --no_trim -p {run}",
         outdir=lambda wildcards, output: Path(output.report).parent.parent,
+        stage=STAGE,
     benchmark:
         BENCH / "predict/tbprofiler/{tech}/{proj}/{sample}/{run}.tsv"
-    shell:
-        """
-        exec 2> {log} # send all stderr from this script to the log file
-
-        reads={input.reads}
-        run_acc={wildcards.run}
-        run_info={input.run_info}
-
-        files_str=$(grep "$run_acc" "$run_info" | cut -f2)
-        n_files=$(awk -F \; '{{print NF}}' <<< "$files_str")
-
-        if [ "$n_files" -eq 2 ]; then
-            tmpout=$(mktemp -d)
-            prefix="${{tmpout}}/${{run_acc}}"
-            # we need to deinterleave the fastq file
-            seqfu deinterleave -o "$prefix" --check "$reads"
-            input_arg=("-1" "${{prefix}}_R1.fq" "-2" "${{prefix}}_R2.fq")
-        else
-            input_arg=("-1" "$reads")
-        fi
-
-        tb-profiler profile "${{input_arg[@]}}" {params.opts} -t {threads} -d {params.outdir} --platform {wildcards.tech}
-
-        """
+    script:
+        SCRIPTS / "tbprofiler_predict.sh"
 
 
 rule combine_tbprofiler_reports:
@@ -163,11 +240,98 @@ rule combine_tbprofiler_reports:
         reports=infer_tbprofiler_reports,
     output:
         report=RESULTS / "amr_predictions/tbprofiler/{tech}/summary.csv",
+        dataset=directory(
+            RESULTS / "amr_predictions/summary.parquet/tool=tbprofiler/technology={tech}"
+        ),
     log:
         LOGS / "combine_tbprofiler_reports/{tech}.log",
+    benchmark:
+        BENCH / "combine_tbprofiler_reports/{tech}.tsv"
     resources:
         mem_mb=GB,
-    container:
-        CONTAINERS["python"]
+    threads: 8
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool="tbprofiler",
+        depth=False,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
     script:
-        str(SCRIPTS / "combine_tbprofiler_reports.py")
+        str(SCRIPTS / "combine_reports.py")
+
+
+# ==========
+# Per-bioproject partial summaries
+# ==========
+rule combine_project_reports:
+    """The summary of a tool's predictions for the runs of a single bioproject. The
+    partials are merged into the technology's summary by merge_report_partials"""
+    input:
+        reports=infer_project_reports,
+    output:
+        report=RESULTS / "amr_predictions/{tool}/{tech}/partials/{proj}.csv",
+    log:
+        LOGS / "combine_project_reports/{tool}/{tech}/{proj}.log",
+    benchmark:
+        BENCH / "combine_project_reports/{tool}/{tech}/{proj}.tsv"
+    wildcard_constraints:
+        tool="|".join(TOOLS),
+        tech="|".join(TECHS),
+    threads: 2
+    resources:
+        mem_mb=GB,
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        tool=lambda wildcards: wildcards.tool,
+        depth=False,
+        store=lambda wildcards, output: Path(output.report).with_suffix(".sqlite"),
+    script:
+        str(SCRIPTS / "combine_reports.py")
+
+
+rule merge_report_partials:
+    input:
+        partials=infer_report_partials,
+    output:
+        report=RESULTS / "amr_predictions/{tool}/{tech}/summary.csv",
+        dataset=directory(
+            RESULTS / "amr_predictions/summary.parquet/tool={tool}/technology={tech}"
+        ),
+    log:
+        LOGS / "merge_report_partials/{tool}/{tech}.log",
+    benchmark:
+        BENCH / "merge_report_partials/{tool}/{tech}.tsv"
+    wildcard_constraints:
+        tool="|".join(TOOLS),
+        tech="|".join(TECHS),
+    resources:
+        mem_mb=GB,
+    conda:
+        str(ENVS / "combine_reports.yaml")
+    params:
+        partition_key=None,
+    script:
+        str(SCRIPTS / "merge_partials.py")
+
+
+# the summaries are combined from every run at once or merged from per-bioproject partials
+if PROJECT_PARTIALS:
+
+    ruleorder: merge_report_partials > combine_mykrobe_reports > combine_drprg_reports > combine_tbprofiler_reports
+
+
+else:
+
+    ruleorder: combine_mykrobe_reports > combine_drprg_reports > combine_tbprofiler_reports > merge_report_partials
+
+
+# drprg predictions come from a job per run or from batches of runs
+if DRPRG_BATCH_SIZE > 1:
+
+    ruleorder: unpack_drprg_batch > drprg_predict
+
+
+else:
+
+    ruleorder: drprg_predict > unpack_drprg_batch
@@ -1,3 +1,22 @@
+# the decontaminated reads can come from extract_decontaminated_reads or streaming_qc.
+# rules using them should refer to this path rather than the output of either rule, as
+# referencing a rule's output ties the input to that rule
+FILTERED_READS = RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/{run}.filtered.fq.gz"
+FILTERED_STATS = RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/{run}.filtered.stats.tsv"
+# how many reads were kept, contaminants, or unmapped. from filter_contamination,
+# unpack_qc_batch, or streaming_qc
+CLASSIFICATION_COUNTS = (
+    RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/classification.json"
+)
+READ_ID_LISTS = dict()
+if KEEP_ALL_READ_IDS:
+    READ_ID_LISTS = dict(
+        keep_ids=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/keep.reads.gz",
+        contam_ids=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/contaminant.reads.gz",
+        unmapped_ids=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/unmapped.reads.gz",
+    )
+
+
 rule preprocessing:
     input:
         run_dir=rules.download_data.output.outdir,
@@ -9,6 +28,8 @@ rule preprocessing:
         mem_mb=lambda wildcards, attempt: attempt * int(16 * GB),
     log:
         LOGS / "preprocessing/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "preprocessing/{tech}/{proj}/{sample}/{run}.tsv"
     conda:
         str(ENVS / "preprocessing.yaml")
     params:
@@ -25,6 +46,30 @@ rule preprocessing:
         """
 
 
+rule raw_read_stats:
+    """The number of reads and bases downloaded for a run, before any QC. The QC rules'
+    benchmarks are normalised by these, rather than by the decontaminated reads"""
+    input:
+        run_dir=rules.download_data.output.outdir,
+        run_info=rules.validate_run_info.output.run_info,
+    output:
+        stats=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/{run}.raw.stats.tsv",
+    threads: 2
+    resources:
+        mem_mb=int(0.5 * GB),
+    log:
+        LOGS / "raw_read_stats/{tech}/{proj}/{sample}/{run}.log",
+    container:
+        CONTAINERS["seqkit"]
+    group:
+        "qc"
+    shell:
+        """
+        files=$(grep {wildcards.run} {input.run_info} | cut -f2 | tr ';' ' ')
+        seqkit stats -T -j {threads} $files > {output.stats} 2> {log}
+        """
+
+
 rule build_decontamination_db:
     output:
         fasta=RESOURCES / "decontamination/remove_contam.fa.gz",
@@ -100,6 +145,8 @@ rule map_to_decontam_db:
         str(ENVS / "aln_tools.yaml")
     log:
         LOGS / "map_to_decontam_db/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "map_to_decontam_db/{tech}/{proj}/{sample}/{run}.tsv"
     shell:
         """
         bash {params.script} -r {wildcards.run} -i {input.run_info} -R {input.reads} \
@@ -112,12 +159,15 @@ rule filter_contamination:
         bam=rules.map_to_decontam_db.output.bam,
         metadata=rules.build_decontamination_db.output.metadata,
     output:
-        keep_ids=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/keep.reads",
-        contam_ids=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/contaminant.reads",
-        unmapped_ids=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/unmapped.reads",
-    threads: 1
+        keep_bitmap=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/keep.bitmap",
+        counts=CLASSIFICATION_COUNTS,
+        # the read IDs are only written if asked for
+        **READ_ID_LISTS,
+    threads: 2
     resources:
-        mem_mb=lambda wildcards, attempt: attempt * 4 * GB,
+        # reads are resolved as they stream out of collate, so memory doesn't grow
+        # with the depth of the run
+        mem_mb=lambda wildcards, attempt: attempt * int(1 * GB),
     group:
         "qc"
     conda:
@@ -125,55 +175,238 @@ rule filter_contamination:
     params:
         script=SCRIPTS / "filter_contamination.py",
         extra="--ignore-secondary",
-        outdir=lambda wildcards, output: Path(output.keep_ids).parent,
+        ids="--ids" if KEEP_ALL_READ_IDS else "--no-ids",
+        outdir=lambda wildcards, output: Path(output.keep_bitmap).parent,
+        tmp_prefix=lambda wildcards, resources: Path(resources.tmpdir)
+        / f"{wildcards.run}.collate",
     log:
         LOGS / "filter_contamination/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "filter_contamination/{tech}/{proj}/{sample}/{run}.tsv"
+    shell:
+        """
+        (samtools collate -u -O -@ {threads} -T {params.tmp_prefix} {input.bam} |
+            python {params.script} {params.extra} {params.ids} --name-grouped \
+                -i - \
+                -m {input.metadata} \
+                -o {params.outdir}) 2> {log}
+        """
+
+
+rule map_and_filter_qc_batch:
+    """Map a batch of runs to the decontamination database and classify their reads in
+    a single job, so the database index is only loaded once for the whole batch. The
+    classifications for each run are written to a subdirectory of the output named
+    after the run."""
+    input:
+        bwa_index=rules.index_decontam_db_with_bwa.output.index,
+        mm2_index=rules.index_decontam_db_with_minimap2.output.index,
+        ref=rules.index_decontam_db_with_bwa.input.fasta,
+        metadata=rules.build_decontamination_db.output.metadata,
+        reads=lambda wildcards: [reads for _, reads, _ in infer_qc_batch_runs(wildcards)],
+        run_info=lambda wildcards: [
+            run_info for _, _, run_info in infer_qc_batch_runs(wildcards)
+        ],
+    output:
+        outdir=temp(directory(RESULTS / "qc_batches/{tech}/{batch}")),
+    wildcard_constraints:
+        batch=r"\d+",
+    threads: 4
+    resources:
+        mem_mb=lambda wildcards, attempt: attempt * int(24 * GB),
+    params:
+        opts=lambda wildcards: infer_map_opts(wildcards),
+        filter_opts=" ".join(
+            [rules.filter_contamination.params.extra, rules.filter_contamination.params.ids]
+        ),
+        script=SCRIPTS / "qc_batch.sh",
+        ref=lambda wildcards, input: infer_map_ref_index(wildcards, input),
+        runs=lambda wildcards: " ".join(
+            ",".join(map(str, entry)) for entry in infer_qc_batch_runs(wildcards)
+        ),
+    conda:
+        str(ENVS / "qc_batch.yaml")
+    log:
+        LOGS / "map_and_filter_qc_batch/{tech}/{batch}.log",
+    benchmark:
+        BENCH / "map_and_filter_qc_batch/{tech}/{batch}.tsv"
     shell:
         """
-        python {params.script} {params.extra} \
-            -i {input.bam} \
-            -m {input.metadata} \
-            -o {params.outdir} 2> {log}
+        bash {params.script} -d {params.ref} -m {input.metadata} -o {output.outdir} \
+            -t {threads} -x "{params.opts}" -f "{params.filter_opts}" \
+            {params.runs} 2> {log}
         """
 
 
+rule unpack_qc_batch:
+    input:
+        batch=infer_qc_batch_dir,
+    output:
+        keep_bitmap=rules.filter_contamination.output.keep_bitmap,
+        counts=rules.filter_contamination.output.counts,
+        **READ_ID_LISTS,
+    group:
+        "qc"
+    resources:
+        mem_mb=int(0.5 * GB),
+    log:
+        LOGS / "unpack_qc_batch/{tech}/{proj}/{sample}/{run}.log",
+    params:
+        indir=lambda wildcards, input: Path(input.batch) / wildcards.run,
+        outdir=lambda wildcards, output: Path(output.keep_bitmap).parent,
+    shell:
+        "cp {params.indir}/* {params.outdir}/ 2> {log}"
+
+
 rule extract_decontaminated_reads:
     input:
         reads=rules.map_to_decontam_db.input.reads,
-        read_ids=rules.filter_contamination.output.keep_ids,
+        # not referenced via rules.filter_contamination, as that would pin this input
+        # to that rule and unpack_qc_batch couldn't provide it
+        keep_bitmap=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/keep.bitmap",
     output:
-        reads=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/{run}.filtered.fq.gz",
-        stats=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/{run}.filtered.stats.tsv",
+        reads=FILTERED_READS,
+        stats=FILTERED_STATS,
     threads: 1
     group:
         "qc"
     resources:
-        mem_mb=lambda wildcards, attempt: int(8 * GB) * attempt,
+        # only the bitmap is held in memory - one bit per read
+        mem_mb=lambda wildcards, attempt: int(1 * GB) * attempt,
     log:
         LOGS / "extract_decontaminated_reads/{tech}/{proj}/{sample}/{run}.log",
-    container:
-        CONTAINERS["seqkit"]
+    benchmark:
+        BENCH / "extract_decontaminated_reads/{tech}/{proj}/{sample}/{run}.tsv"
+    conda:
+        str(ENVS / "extract_reads.yaml")
+    params:
+        script=SCRIPTS / "extract_reads.py",
+    shell:
+        """
+        python {params.script} -i {input.reads} -b {input.keep_bitmap} \
+            -s {output.stats} -n {output.reads} 2> {log} | gzip -c > {output.reads}
+        """
+
+
+rule streaming_qc:
+    """Preprocess the reads, map them to the decontamination database, and write the
+    reads that aren't contamination, in a single pass. The reads are classified as
+    their alignments stream out of the mapper, so there is no intermediate fastq, BAM,
+    or read ID files. Only used when streaming_qc is set in the config."""
+    input:
+        run_dir=rules.download_data.output.outdir,
+        run_info=rules.validate_run_info.output.run_info,
+        bwa_index=rules.index_decontam_db_with_bwa.output.index,
+        mm2_index=rules.index_decontam_db_with_minimap2.output.index,
+        ref=rules.index_decontam_db_with_bwa.input.fasta,
+        metadata=rules.build_decontamination_db.output.metadata,
+    output:
+        reads=FILTERED_READS,
+        stats=FILTERED_STATS,
+        counts=CLASSIFICATION_COUNTS,
+    threads: 4
+    resources:
+        mem_mb=lambda wildcards, attempt: attempt * int(16 * GB),
+    log:
+        LOGS / "streaming_qc/{tech}/{proj}/{sample}/{run}.log",
+    benchmark:
+        BENCH / "streaming_qc/{tech}/{proj}/{sample}/{run}.tsv"
+    conda:
+        str(ENVS / "streaming_qc.yaml")
+    params:
+        preprocessing_opts=infer_streaming_preprocessing_opts,
+        map_opts=infer_map_opts,
+        filter_opts=rules.filter_contamination.params.extra,
+        script=SCRIPTS / "streaming_qc.sh",
+        ref=lambda wildcards, input: infer_map_ref_index(wildcards, input),
+    shadow:
+        "shallow"
+    group:
+        "qc"
     shell:
         """
-        seqkit grep -o {output.reads} -f {input.read_ids} {input.reads} 2> {log}
-        seqkit stats -a -T {output.reads} > {output.stats} 2>> {log}
+        bash {params.script} -r {wildcards.run} -i {input.run_info} -d {params.ref} \
+            -m {input.metadata} -o {output.reads} -s {output.stats} \
+            -c {output.counts} -t {threads} -p "{params.preprocessing_opts}" \
+            -f "{params.filter_opts}" {params.map_opts} 2> {log}
         """
 
 
+rule qc_record:
+    """A single line of JSON with the read classification counts and fractions, the
+    number of bases and coverage of the decontaminated reads, and the number of bases
+    downloaded"""
+    input:
+        counts=CLASSIFICATION_COUNTS,
+        stats=FILTERED_STATS,
+        raw_stats=rules.raw_read_stats.output.stats,
+    output:
+        record=RESULTS / "filtered/{tech}/{proj}/{sample}/{run}/{run}.qc.json",
+    resources:
+        mem_mb=int(0.5 * GB),
+    log:
+        LOGS / "qc_record/{tech}/{proj}/{sample}/{run}.log",
+    params:
+        genome_size=config["genome_size"],
+    container:
+        CONTAINERS["python"]
+    group:
+        "qc"
+    script:
+        str(SCRIPTS / "qc_record.py")
+
+
+rule qc_record_shard:
+    """Concatenate the QC records of a bioproject, so qc_summary opens one file per
+    bioproject rather than a few per run"""
+    input:
+        records=infer_qc_records,
+    output:
+        shard=RESULTS / "QC/records/{tech}/{proj}.jsonl",
+    resources:
+        mem_mb=int(0.5 * GB),
+    log:
+        LOGS / "qc_record_shard/{tech}/{proj}.log",
+    shell:
+        "cat {input.records} > {output.shard} 2> {log}"
+
+
 rule qc_summary:
+    """The summary is exported from a SQLite store of the QC records, keyed by run. The
+    store remembers the size and modification time of each record shard it has loaded,
+    so only new or changed shards are read when the summary is updated. It is not an
+    output of the rule, as Snakemake would delete it before rerunning the rule"""
     input:
-        stats=infer_stats_files,
-        keep_ids=infer_keep_files,
-        contam_ids=infer_contam_files,
-        unmapped_ids=infer_unmapped_files,
+        records=infer_qc_record_shards,
     output:
         summary=RESULTS / "QC/{tech}.qc.csv",
-    threads: 16
     resources:
-        mem_mb=int(16*GB),
+        mem_mb=int(2 * GB),
     log:
         LOGS / "qc_summary/{tech}.log",
+    benchmark:
+        BENCH / "qc_summary/{tech}.tsv"
     params:
-        genome_size=4411532,
+        store=lambda wildcards: RESULTS / f"QC/{wildcards.tech}.qc.sqlite",
     script:
         str(SCRIPTS / "qc_summary.py")
+
+
+# several rules can produce the read classifications and decontaminated reads. which is
+# used depends on whether the QC is streamed or batched
+if STREAMING_QC:
+
+    ruleorder: streaming_qc > unpack_qc_batch > filter_contamination
+    ruleorder: streaming_qc > extract_decontaminated_reads
+
+
+elif QC_BATCH_SIZE > 1:
+
+    ruleorder: unpack_qc_batch > filter_contamination > streaming_qc
+    ruleorder: extract_decontaminated_reads > streaming_qc
+
+
+else:
+
+    ruleorder: filter_contamination > unpack_qc_batch > streaming_qc
+    ruleorder: extract_decontaminated_reads > streaming_qc
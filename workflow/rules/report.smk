@@ -1,4 +1,6 @@
 rule plot_phenotype_availability:
+    input:
+        samplesheet=rules.compile_samplesheet.output.samplesheet,
     output:
         upset_plots=report(
             multiext(str(PLOTS / "dst_availability/upset.{tech}"), ".png", ".svg"),
@@ -14,14 +16,12 @@ rule plot_phenotype_availability:
         ),
     log:
         LOGS / "plot_phenotype_availability/{tech}.log",
+    benchmark:
+        BENCH / "plot_phenotype_availability/{tech}.tsv"
     resources:
-        mem_mb=lambda wildcards, attempt: attempt * int(30*GB),
+        mem_mb=lambda wildcards, attempt: attempt * int(4 * GB),
     conda:
         ENVS / "plot_phenotype_availability.yaml"
-    params:
-        samplesheet=(
-            lambda wildcards: illumina_df if wildcards.tech == "illumina" else ont_df
-        ),
     script:
         SCRIPTS / "plot_susceptibility_availability.py"
 
@@ -38,6 +38,8 @@ rule plot_sample_depth:
         )
     log:
         LOGS / "plot_sample_depth/{tech}.log"
+    benchmark:
+        BENCH / "plot_sample_depth/{tech}.tsv"
     conda:
         ENVS / "plot_predict_benchmark.yaml"
     script:
@@ -48,7 +50,7 @@ rule compare_sn_and_sp:
         summary_files=expand(
             str(RESULTS / "amr_predictions/{tool}/{{tech}}/summary.csv"), tool=TOOLS
         ),
-        phenotypes=lambda wildcards: config[f"{wildcards.tech}_samplesheet"],
+        phenotypes=rules.compile_samplesheet.output.samplesheet,
         qc=rules.qc_summary.output.summary,
     output:
         plots=report(
@@ -71,6 +73,8 @@ rule compare_sn_and_sp:
         ),
     log:
         LOGS / "compare_sn_and_sp/{tech}.log",
+    benchmark:
+        BENCH / "compare_sn_and_sp/{tech}.tsv"
     resources:
         mem_mb=GB,
     params:
@@ -98,6 +102,27 @@ rule aggregate_predict_benchmarks:
         summary=BENCH / "predict/{tech}.summary.csv",
     log:
         LOGS / "aggregate_predict_benchmarks/{tech}.log",
+    benchmark:
+        BENCH / "aggregate_predict_benchmarks/{tech}.tsv"
+    resources:
+        mem_mb=GB,
+    container:
+        CONTAINERS["python"]
+    params:
+        delim=",",
+    script:
+        SCRIPTS / "aggregate_predict_benchmarks.py"
+
+
+rule aggregate_project_predict_benchmarks:
+    input:
+        bench=infer_project_benchmark_reports,
+    output:
+        summary=BENCH / "predict/partials/{tech}/{proj}.csv",
+    log:
+        LOGS / "aggregate_project_predict_benchmarks/{tech}/{proj}.log",
+    benchmark:
+        BENCH / "aggregate_project_predict_benchmarks/{tech}/{proj}.tsv"
     resources:
         mem_mb=GB,
     container:
@@ -108,9 +133,86 @@ rule aggregate_predict_benchmarks:
         SCRIPTS / "aggregate_predict_benchmarks.py"
 
 
+rule merge_predict_benchmark_partials:
+    input:
+        partials=infer_benchmark_partials,
+    output:
+        summary=BENCH / "predict/{tech}.summary.csv",
+    log:
+        LOGS / "merge_predict_benchmark_partials/{tech}.log",
+    wildcard_constraints:
+        tech="|".join(TECHS),
+    benchmark:
+        BENCH / "merge_predict_benchmark_partials/{tech}.tsv"
+    resources:
+        mem_mb=GB,
+    container:
+        CONTAINERS["python"]
+    script:
+        SCRIPTS / "merge_partials.py"
+
+
+if PROJECT_PARTIALS:
+
+    ruleorder: merge_predict_benchmark_partials > aggregate_predict_benchmarks
+
+
+else:
+
+    ruleorder: aggregate_predict_benchmarks > merge_predict_benchmark_partials
+
+
+rule aggregate_benchmarks:
+    """A table of the benchmark of every job that runs for a technology, with the CPU
+    time per gigabase of reads for jobs that process a single run"""
+    input:
+        bench=infer_pipeline_benchmarks,
+        records=infer_qc_record_shards,
+    output:
+        summary=BENCH / "{tech}.summary.csv",
+    log:
+        LOGS / "aggregate_benchmarks/{tech}.log",
+    wildcard_constraints:
+        tech="|".join(TECHS),
+    resources:
+        mem_mb=GB,
+    container:
+        CONTAINERS["python"]
+    params:
+        templates={
+            rule: str(RESULTS / template)
+            for rule, template in BENCHMARK_TEMPLATES.items()
+        },
+        genome_size=config["genome_size"],
+    script:
+        SCRIPTS / "aggregate_benchmarks.py"
+
+
+rule fit_resource_model:
+    """Fit the memory, runtime, and threads of each predictor, for each tech, to the
+    size of the reads from their benchmarks"""
+    input:
+        bench=infer_all_benchmark_reports,
+    output:
+        model=RESOURCE_MODEL,
+    log:
+        LOGS / "fit_resource_model.log",
+    resources:
+        mem_mb=GB,
+    container:
+        CONTAINERS["python"]
+    params:
+        reads=str(FILTERED_READS),
+        quantile=0.95,
+        min_runs=10,
+        max_threads=8,
+    script:
+        SCRIPTS / "fit_resource_model.py"
+
+
 rule plot_predict_benchmark:
     input:
-        summary=rules.aggregate_predict_benchmarks.output.summary,
+        summary=BENCH / "predict/{tech}.summary.csv",
     output:
         memory_plots=report(
             multiext(str(PLOTS / "benchmark/predict/memory.{tech}"), ".png", ".svg"),
@@ -124,6 +226,8 @@ rule plot_predict_benchmark:
         ),
     log:
         LOGS / "plot_predict_benchmark/{tech}.log",
+    benchmark:
+        BENCH / "plot_predict_benchmark/{tech}.tsv"
     resources:
         mem_mb=GB,
     conda:
@@ -2,6 +2,12 @@
 to see what works best for drprg.
 """
 WK_SWEEP = RESULTS / "drprg/wk_sweep"
+# how predictions are classified against the phenotypes when scoring combinations
+WK_CLASSIFICATION = dict(
+    unknown_is_resistant=False,
+    failed_is_resistant=False,
+    minor_is_susceptible=False,
+)
 
 
 rule seqtk_mergepe:
@@ -57,16 +63,32 @@ rule drprg_predict_sweep:
         """
 
 
+checkpoint wk_sweep_round:
+    """Score the combinations of a round of the adaptive sweep by their FN and FP counts
+    and mark the best 1/eta of them to advance to the next round"""
+    input:
+        reports=infer_wk_round_reports,
+        phenotypes=config["h2h_phenotypes"],
+    output:
+        scores=WK_SWEEP / "adaptive/round{round}.csv",
+    log:
+        LOGS / "wk_sweep_round/{round}.log",
+    wildcard_constraints:
+        round=r"\d+",
+    resources:
+        mem_mb=GB,
+    container:
+        CONTAINERS["python"]
+    params:
+        eta=WK_SWEEP_CONFIG.get("eta", 3),
+        **WK_CLASSIFICATION,
+    script:
+        str(SCRIPTS / "score_wk_round.py")
+
+
 rule aggregate_wk_results:
     input:
-        reports=expand(
-            WK_SWEEP / "predict/w{w}/k{k}/{tech}/{sample}/{sample}.drprg.json",
-            zip,
-            tech=WK_WILDCARDS["tech"],
-            w=WK_WILDCARDS["w"],
-            k=WK_WILDCARDS["k"],
-            sample=WK_WILDCARDS["sample"],
-        ),
+        reports=infer_wk_reports,
     output:
         sheet=WK_SWEEP / "predict/results.csv",
     log:
@@ -95,9 +117,7 @@ rule plot_wk_results:
     conda:
         str(ENVS / "plot_wk_sweep.yaml")
     params:
-        unknown_is_resistant=False,
-        failed_is_resistant=False,
-        minor_is_susceptible=False,
+        **WK_CLASSIFICATION,
         style="ggplot",
         figsize=(13, 8),
         dpi=300,
@@ -0,0 +1,121 @@
+import sys
+
+sys.stderr = open(snakemake.log[0], "w")
+
+import csv
+import json
+import re
+import string
+from pathlib import Path
+
+FIELDS = ["s", "cpu_time", "max_rss", "io_in", "io_out"]
+HEADER = [
+    "technology",
+    "rule",
+    "job",
+    "run",
+    "depth",
+    *FIELDS,
+    "bases",
+    "cpu_s_per_gbase",
+]
+# the rules that take the reads before they are decontaminated, so are normalised by the
+# bases downloaded rather than the bases kept
+QC_RULES = {
+    "preprocessing",
+    "map_to_decontam_db",
+    "filter_contamination",
+    "extract_decontaminated_reads",
+    "streaming_qc",
+}
+
+
+def template_regex(template: str) -> re.Pattern:
+    """A regex that matches paths built from a template, with a named group for each
+    wildcard"""
+    pattern = ""
+    for literal, field, _, _ in string.Formatter().parse(template):
+        pattern += re.escape(literal)
+        if field is not None:
+            pattern += f"(?P<{field}>[^/]+)"
+    return re.compile(pattern + "$")
+
+
+def load_bases(paths: list[str]) -> tuple[dict[str, int], dict[str, int]]:
+    """The number of bases downloaded for each run, and the number in its
+    decontaminated reads, from its QC record"""
+    raw_bases = dict()
+    bases = dict()
+    for path in paths:
+        with open(path) as fp:
+            for line in fp:
+                record = json.loads(line)
+                raw_bases[record["run"]] = int(record["raw_sum_len"])
+                bases[record["run"]] = int(record["sum_len"])
+
+    return raw_bases, bases
+
+
+def main():
+    tech = snakemake.wildcards.tech
+    genome_size = snakemake.params.genome_size
+    regexes = {
+        rule: template_regex(template)
+        for rule, template in snakemake.params.templates.items()
+    }
+    raw_bases_per_run, bases_per_run = load_bases(snakemake.input.records)
+
+    with open(snakemake.output.summary, "w", newline="") as fp_out:
+        writer = csv.writer(fp_out)
+        writer.writerow(HEADER)
+
+        for path in snakemake.input.bench:
+            for rule, regex in regexes.items():
+                match = regex.match(str(path))
+                if match is not None:
+                    break
+            else:
+                print(f"{path} does not match any benchmark layout", file=sys.stderr)
+                continue
+
+            wildcards = match.groupdict()
+            wildcards.pop("tech", None)
+            run = wildcards.get("run", "")
+            depth = wildcards.get("depth", "")
+            job = ";".join(f"{k}={v}" for k, v in wildcards.items())
+
+            # batch and per-technology jobs don't have a single run to normalise by
+            per_run = raw_bases_per_run if rule in QC_RULES else bases_per_run
+            bases = per_run.get(run) if run else None
+            if bases is not None and depth:
+                bases = min(bases, int(depth) * genome_size)
+
+            with open(path) as fp_in:
+                for row in csv.DictReader(fp_in, delimiter="\t"):
+                    values = [row.get(field, "NA") for field in FIELDS]
+                    try:
+                        cpu_time = float(row["cpu_time"])
+                    except (KeyError, ValueError):
+                        cpu_time = None
+
+                    if bases and cpu_time is not None:
+                        throughput = f"{cpu_time / (bases / 1e9):.2f}"
+                    else:
+                        throughput = "NA"
+
+                    writer.writerow(
+                        [
+                            tech,
+                            rule,
+                            job,
+                            run,
+                            depth,
+                            *values,
+                            "NA" if bases is None else bases,
+                            throughput,
+                        ]
+                    )
+
+
+if __name__ == "__main__":
+    main()
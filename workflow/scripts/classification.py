@@ -0,0 +1,82 @@
+"""How predictions of resistance are classified against phenotypes, shared by the
+scripts that score the w/k sweep.
+"""
+from enum import Enum
+
+
+class Prediction(Enum):
+    Resistant = "R"
+    Susceptible = "S"
+    MinorResistance = "r"
+    Unknown = "U"
+    MinorUnknown = "u"
+    Failed = "F"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class Classification(Enum):
+    TruePositive = "TP"
+    FalsePositive = "FP"
+    TrueNegative = "TN"
+    FalseNegative = "FN"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class Classifier:
+    def __init__(
+        self,
+        minor_is_susceptible: bool = False,
+        unknown_is_resistant: bool = False,
+        failed_is_resistant: bool = False,
+    ):
+        self.minor_is_susceptible = minor_is_susceptible
+        self.unknown_is_resistant = unknown_is_resistant
+        self.failed_is_resistant = failed_is_resistant
+        self.susceptible = {Prediction.Susceptible}
+        self.resistant = {Prediction.Resistant}
+        if self.minor_is_susceptible:
+            self.susceptible.add(Prediction.MinorResistance)
+        else:
+            self.resistant.add(Prediction.MinorResistance)
+
+        if self.unknown_is_resistant:
+            self.resistant.add(Prediction.Unknown)
+            self.resistant.add(Prediction.MinorUnknown)
+        else:
+            self.susceptible.add(Prediction.Unknown)
+            self.susceptible.add(Prediction.MinorUnknown)
+
+        if self.failed_is_resistant:
+            self.resistant.add(Prediction.Failed)
+        else:
+            self.susceptible.add(Prediction.Failed)
+
+    def from_predictions(
+        self, y_true: Prediction, y_pred: Prediction
+    ) -> Classification:
+        if y_true in self.susceptible:
+            expected_susceptible = True
+        elif y_true in self.resistant:
+            expected_susceptible = False
+        else:
+            raise NotImplementedError(f"Don't know how to classify {y_true} calls yet")
+
+        if y_pred in self.susceptible:
+            called_susceptible = True
+        elif y_pred in self.resistant:
+            called_susceptible = False
+        else:
+            raise NotImplementedError(f"Don't know how to classify {y_pred} calls yet")
+
+        if expected_susceptible and called_susceptible:
+            return Classification.TrueNegative
+        elif expected_susceptible and not called_susceptible:
+            return Classification.FalsePositive
+        elif not expected_susceptible and not called_susceptible:
+            return Classification.TruePositive
+        else:
+            return Classification.FalseNegative
@@ -0,0 +1,475 @@
+import sys
+
+sys.stderr = open(snakemake.log[0], "w")
+
+import gzip
+import json
+import os
+import sqlite3
+from collections import defaultdict, deque
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import ijson
+except ImportError:  # reports are loaded whole instead
+    ijson = None
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+N = 100  # number of files to pass to a process
+# number of chunks of files, per process, that are submitted but whose rows have not yet
+# been written to the store. this bounds the rows held in the parent when the workers
+# parse faster than the parent writes
+MAX_CHUNKS_PER_PROCESS = 2
+BATCH_ROWS = 100_000  # number of rows to buffer for each parquet row group
+ID_COLUMNS = ["run", "biosample", "bioproject", "technology", "tool"]
+# the rows of every report are kept in a SQLite store, along with the size and
+# modification time of the report when it was parsed, so only new or changed reports are
+# parsed when a summary is updated. bump the version when the rows a parser produces
+# change, so stores made by the old parsers are rebuilt
+STORE_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    source TEXT NOT NULL REFERENCES sources(path),
+    part TEXT NOT NULL,
+    fields TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rows_source ON rows(source);
+"""
+COMMIT_EVERY = 1_000  # number of parsed reports to commit to the store at once
+
+if str(snakemake.output.report).endswith("csv"):
+    DELIM = ","
+elif str(snakemake.output.report).endswith("tsv"):
+    DELIM = "\t"
+else:
+    raise NotImplementedError("Don't know output delimiter")
+
+
+def eprint(msg):
+    print(msg, file=sys.stderr)
+
+
+ANY_KEY = "*"
+ARRAY_ITEM = object()  # the "key" of a value in an array
+CONTAINER_STARTS = ("start_map", "start_array")
+CONTAINER_ENDS = ("end_map", "end_array")
+
+
+def build_value(event: str, value, events):
+    """Build the value that starts with the given event from the rest of its events"""
+    builder = ijson.ObjectBuilder()
+    builder.event(event, value)
+    depth = int(event in CONTAINER_STARTS)
+    while depth:
+        _, event, value = next(events)
+        builder.event(event, value)
+        if event in CONTAINER_STARTS:
+            depth += 1
+        elif event in CONTAINER_ENDS:
+            depth -= 1
+
+    return builder.value
+
+
+def select_json(fp, paths: tuple[tuple[str, ...], ...], stop_after: int) -> dict:
+    """Stream a JSON object, building only the values at the given key paths (ANY_KEY
+    matches any key) into a dict with the same nesting as the document. Everything else
+    is tokenised, but never built into Python objects. Reading stops once stop_after
+    values have been found"""
+    data = dict()
+    # the key of the current value in each of the open maps and arrays
+    keys = []
+    n_found = 0
+    events = ijson.parse(fp, use_float=True)
+    for _, event, value in events:
+        if event == "map_key":
+            keys[-1] = value
+            continue
+        if event in CONTAINER_ENDS:
+            keys.pop()
+            continue
+
+        if any(
+            len(path) == len(keys)
+            and all(p == ANY_KEY or p == k for p, k in zip(path, keys))
+            for path in paths
+        ):
+            node = data
+            for key in keys[:-1]:
+                node = node.setdefault(key, dict())
+            node[keys[-1]] = build_value(event, value, events)
+            n_found += 1
+            if n_found == stop_after:
+                break
+        elif event == "start_map":
+            keys.append(None)
+        elif event == "start_array":
+            keys.append(ARRAY_ITEM)
+
+    return data
+
+
+class ReportParser:
+    """Turns a tool's report for a run into the rows of the summary. The rows start
+    with the drug and prediction, followed by the tool's extra columns, which are only
+    kept in the full (not depth) summary"""
+
+    tool: str
+    extra_columns: list[str] = []
+    # how far from the end of a report's path its bioproject directory is. the sample,
+    # and the depth for depth reports, are found relative to it
+    proj_part: int
+    # whether a report with no results is an error, rather than a warning, for the full
+    # summary
+    require_results: bool = False
+    # the key paths of the parts of the report that parse uses. when ijson is available
+    # only these are built, and the rest of the report is skipped over
+    keys: tuple[tuple[str, ...], ...]
+    # the number of keys to find before the rest of the report can be ignored
+    # [default: all of them]
+    stop_after: Optional[int] = None
+
+    def load(self, p: Path) -> dict:
+        fopen = gzip.open if p.suffix == ".gz" else open
+        with fopen(p, "rb") as fp:
+            if ijson is None:
+                return json_loads(fp.read())
+            return select_json(fp, self.keys, self.stop_after or len(self.keys))
+
+    def locate(self, p: Path) -> tuple[str, str, str]:
+        """The bioproject, sample, and run of a report"""
+        proj = p.parts[self.proj_part]
+        sample = p.parts[self.proj_part + 1]
+        return proj, sample, self.run_name(p)
+
+    def depth(self, p: Path) -> str:
+        return p.parts[self.proj_part - 2]
+
+    def run_name(self, p: Path) -> str:
+        return p.name.split(".")[0]
+
+    def parse(self, data: dict) -> list[tuple[str, ...]]:
+        raise NotImplementedError
+
+
+PARSERS: dict[str, ReportParser] = dict()
+
+
+def register(cls):
+    PARSERS[cls.tool] = cls()
+    return cls
+
+
+@register
+class MykrobeParser(ReportParser):
+    tool = "mykrobe"
+    extra_columns = ["mutations"]
+    proj_part = -3
+    require_results = True
+    # the results are usually under the sample name. susceptibility comes before the
+    # (large) probe and coverage data, so they are never read
+    keys = ((ANY_KEY, "susceptibility"), ("susceptibility",))
+    stop_after = 1
+
+    @staticmethod
+    def evidence_to_str(evidence: dict[str, dict]) -> str:
+        return ";".join(variant.split("-")[0] for variant in evidence)
+
+    def parse(self, data: dict) -> list[tuple[str, ...]]:
+        try:
+            report = data[next(iter(data.keys()))]["susceptibility"]
+        except (KeyError, TypeError):
+            report = data["susceptibility"]
+
+        return [
+            (
+                drug,
+                pred["predict"],
+                self.evidence_to_str(pred.get("called_by", dict())),
+            )
+            for drug, pred in report.items()
+        ]
+
+
+@register
+class DrprgParser(ReportParser):
+    tool = "drprg"
+    extra_columns = ["mutations"]
+    proj_part = -4
+    keys = (("susceptibility",),)
+
+    @staticmethod
+    def evidence_to_str(evidence: list[dict]) -> str:
+        return ";".join(f"{ev['gene']}_{ev['variant']}" for ev in evidence)
+
+    def parse(self, data: dict) -> list[tuple[str, ...]]:
+        return [
+            (drug, pred["predict"], self.evidence_to_str(pred["evidence"]))
+            for drug, pred in data["susceptibility"].items()
+        ]
+
+
+@register
+class TbprofilerParser(ReportParser):
+    tool = "tbprofiler"
+    extra_columns = ["lineage", "mutations"]
+    proj_part = -5
+    keys = (("sublin",), ("dr_variants",))
+
+    def run_name(self, p: Path) -> str:
+        return p.parts[-3]
+
+    def parse(self, data: dict) -> list[tuple[str, ...]]:
+        """tb-profiler only reports the drugs a run is resistant to. a run with no
+        resistance gets a single row for all drugs"""
+        lineage = data.get("sublin", "")
+        if not data["dr_variants"]:
+            return [("all", "S", lineage, "")]
+
+        drug_variants = defaultdict(set)
+        for variant in data["dr_variants"]:
+            mut = f"{variant['gene']}_{variant['change']}"
+            for info in variant["drugs"]:
+                if info["confers"] == "resistance":
+                    drug_variants[info["drug"]].add(mut)
+
+        return [
+            (drug, "R", lineage, ";".join(sorted(mutations)))
+            for drug, mutations in drug_variants.items()
+        ]
+
+
+class Combiner:
+    def __init__(self, parser: ReportParser, tech: str, by_depth: bool):
+        self.parser = parser
+        self.tech = tech
+        self.by_depth = by_depth
+        if by_depth:
+            self.value_columns = ["drug", "prediction", "depth"]
+        else:
+            self.value_columns = ["drug", "prediction", *parser.extra_columns]
+
+    @property
+    def header(self) -> list[str]:
+        return [*ID_COLUMNS, *self.value_columns]
+
+    def load_report(self, p: Path) -> tuple[str, list[tuple[str, ...]]]:
+        """The partition (depth) and summary rows of a report"""
+        proj, sample, run = self.parser.locate(p)
+        ids = (run, sample, proj, self.tech, self.parser.tool)
+        rows = self.parser.parse(self.parser.load(p))
+
+        if not rows:
+            msg = f"{run} has no susceptibility results"
+            if self.parser.require_results and not self.by_depth:
+                raise ValueError(msg)
+            eprint(f"[WARNING] {msg}")
+
+        if self.by_depth:
+            depth = self.parser.depth(p)
+            return depth, [(*ids, *row[:2], depth) for row in rows]
+
+        return "", [(*ids, *row) for row in rows]
+
+    def load_reports(
+        self, paths: list[Path]
+    ) -> list[tuple[str, list[tuple[str, ...]]]]:
+        """The partitions and summary rows of a chunk of reports"""
+        return [self.load_report(p) for p in paths]
+
+
+class DatasetWriter:
+    """Writes rows to a hive-partitioned parquet dataset. The technology and tool (and
+    depth) are partition keys, so they are not stored in the files"""
+
+    def __init__(self, root: Path, columns: list[str], partition_key: Optional[str]):
+        self.root = root
+        self.columns = columns
+        self.partition_key = partition_key
+        # the partition keys are in the directory names rather than the files
+        self.keep = [
+            i
+            for i, c in enumerate(columns)
+            if c not in ("technology", "tool", partition_key)
+        ]
+        self.schema = pa.schema([(columns[i], pa.string()) for i in self.keep])
+        self.writers = dict()
+        self.buffers = defaultdict(list)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def write(self, partition: str, rows: list[tuple[str, ...]]):
+        buffer = self.buffers[partition]
+        buffer.extend(rows)
+        if len(buffer) >= BATCH_ROWS:
+            self.flush(partition)
+
+    def flush(self, partition: str):
+        rows = self.buffers.pop(partition, [])
+        if not rows:
+            return
+        if partition not in self.writers:
+            outdir = self.root
+            if self.partition_key is not None:
+                outdir /= f"{self.partition_key}={partition}"
+            outdir.mkdir(parents=True, exist_ok=True)
+            self.writers[partition] = pq.ParquetWriter(
+                outdir / "part-0.parquet", self.schema, compression="zstd"
+            )
+        table = pa.Table.from_arrays(
+            [pa.array([row[i] for row in rows], pa.string()) for i in self.keep],
+            schema=self.schema,
+        )
+        self.writers[partition].write_table(table)
+
+    def close(self):
+        for partition in list(self.buffers):
+            self.flush(partition)
+        for writer in self.writers.values():
+            writer.close()
+
+
+def open_store(path: str, header: list[str]) -> sqlite3.Connection:
+    """Open the store, emptying it if it was made by a different version of the
+    parsers or for a summary with different columns"""
+    conn = sqlite3.connect(path)
+    identity = json.dumps({"version": STORE_VERSION, "columns": header})
+    with conn:
+        conn.executescript(SCHEMA)
+        stored = conn.execute(
+            "SELECT value FROM meta WHERE key = 'identity'"
+        ).fetchone()
+        if stored is not None and stored[0] != identity:
+            eprint(f"{path} was made by different parsers. Emptying it...")
+            conn.execute("DELETE FROM rows")
+            conn.execute("DELETE FROM sources")
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('identity', ?)", (identity,))
+
+    return conn
+
+
+def imap_bounded(pool, combiner: Combiner, paths: list[Path], max_chunks: int):
+    """Yield the partition and rows of each report, in the order of the paths, as the
+    workers finish parsing them. Unlike pool.imap, at most max_chunks chunks are in
+    flight at once, so the parsed rows waiting to be consumed never exceed that many
+    chunks, however many reports there are"""
+    in_flight = deque()
+    for i in range(0, len(paths), N):
+        if len(in_flight) >= max_chunks:
+            yield from in_flight.popleft().get()
+        in_flight.append(pool.apply_async(combiner.load_reports, (paths[i : i + N],)))
+
+    while in_flight:
+        yield from in_flight.popleft().get()
+
+
+def update(
+    conn: sqlite3.Connection, combiner: Combiner, reports: list[Path], threads: int
+) -> int:
+    """Bring the store up to date with the given reports. Only reports whose size or
+    modification time differ from when they were last parsed are read. Returns the
+    number of reports parsed"""
+    known = {
+        path: (size, mtime_ns)
+        for path, size, mtime_ns in conn.execute("SELECT * FROM sources")
+    }
+
+    with conn:
+        for path in set(known) - set(map(str, reports)):
+            conn.execute("DELETE FROM rows WHERE source = ?", (path,))
+            conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+
+    stale = []
+    for p in reports:
+        st = os.stat(p)
+        if known.get(str(p)) != (st.st_size, st.st_mtime_ns):
+            stale.append((p, st))
+
+    if not stale:
+        return 0
+
+    with Pool(threads) as pool:
+        results = imap_bounded(
+            pool, combiner, [p for p, _ in stale], MAX_CHUNKS_PER_PROCESS * threads
+        )
+        for i, ((p, st), (partition, rows)) in enumerate(zip(stale, results), start=1):
+            conn.execute("DELETE FROM rows WHERE source = ?", (str(p),))
+            conn.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                (str(p), st.st_size, st.st_mtime_ns),
+            )
+            conn.executemany(
+                "INSERT INTO rows VALUES (?, ?, ?)",
+                ((str(p), partition, json.dumps(row)) for row in rows),
+            )
+            # commit as we go, so the reports parsed before a failure are kept
+            if i % COMMIT_EVERY == 0:
+                conn.commit()
+    conn.commit()
+
+    return len(stale)
+
+
+def main():
+    tool = snakemake.params.tool
+    by_depth = snakemake.params.depth
+    combiner = Combiner(PARSERS[tool], snakemake.wildcards.tech, by_depth)
+    # a bioproject's partial summary has no dataset. it is written when they are merged
+    dataset_root = getattr(snakemake.output, "dataset", None)
+    if dataset_root is not None:
+        dataset = DatasetWriter(
+            Path(dataset_root),
+            combiner.header,
+            partition_key="depth" if by_depth else None,
+        )
+    else:
+        dataset = None
+    reports = list(map(Path, snakemake.input.reports))
+    n_rows = 0
+
+    conn = open_store(str(snakemake.params.store), combiner.header)
+    try:
+        n_parsed = update(conn, combiner, reports, snakemake.threads)
+        eprint(f"Parsed {n_parsed} of {len(reports)} {tool} reports")
+
+        # the summary is in the same order as the reports
+        with open(snakemake.output.report, "w") as fout:
+            print(DELIM.join(combiner.header), file=fout)
+            for p in reports:
+                rows = conn.execute(
+                    "SELECT part, fields FROM rows WHERE source = ? ORDER BY rowid",
+                    (str(p),),
+                )
+                for partition, fields in rows:
+                    row = json.loads(fields)
+                    print(DELIM.join(row), file=fout)
+                    if dataset is not None:
+                        dataset.write(partition, [row])
+                    n_rows += 1
+    finally:
+        conn.close()
+
+    if dataset is not None:
+        dataset.close()
+    eprint(f"Combined {n_rows} rows from {len(reports)} {tool} reports")
+
+
+if __name__ == "__main__":
+    main()
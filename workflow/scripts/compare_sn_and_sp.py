@@ -13,6 +13,7 @@ import matplotlib.lines as mlines
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from matplotlib.colors import to_rgba
 from scipy import stats
 
@@ -206,9 +207,14 @@ def main():
         ["run", "tool", "drug"], verify_integrity=True, inplace=True, drop=False
     )
 
-    phenotypes = pd.read_csv(
-        snakemake.input.phenotypes, index_col="run", low_memory=False
-    )
+    # only read the phenotype columns for drugs we have predictions for
+    pheno_drugs = set(calls["drug"])
+    pheno_cols = [
+        c for c in pq.read_schema(snakemake.input.phenotypes).names if c in pheno_drugs
+    ]
+    phenotypes = pd.read_parquet(
+        snakemake.input.phenotypes, columns=["run", *pheno_cols]
+    ).set_index("run")
 
     min_depth = snakemake.params.min_depth
     max_contam = snakemake.params.max_contamination
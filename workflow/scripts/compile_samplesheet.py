@@ -0,0 +1,46 @@
+import sys
+
+sys.stderr = open(snakemake.log[0], "w")
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ID_COLUMNS = ["run", "bioproject", "biosample"]
+PHENOTYPE = pd.CategoricalDtype(categories=["R", "S"])
+
+
+def main():
+    df = pd.read_csv(snakemake.input.samplesheet, dtype=str)
+    drugs = sorted(c for c in df.columns if c not in ID_COLUMNS)
+
+    for drug in drugs:
+        unknown = set(df[drug].dropna()) - set(PHENOTYPE.categories)
+        if unknown:
+            raise ValueError(f"Got unexpected phenotype(s) {unknown} for {drug}")
+        df[drug] = df[drug].astype(PHENOTYPE)
+
+    # sorting by bioproject keeps each project in as few row groups as possible, so
+    # filters on it can skip most of the file
+    df = df[ID_COLUMNS + drugs].sort_values(by=["bioproject", "run"])
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # the identifiers are dictionary-encoded per row group. they are left as plain
+    # strings in the arrow schema as a pandas category would store the dictionary of
+    # all ~45k runs in every row group
+    pq.write_table(
+        table,
+        snakemake.output.samplesheet,
+        row_group_size=snakemake.params.row_group_size,
+        use_dictionary=True,
+        compression="zstd",
+    )
+    print(
+        f"Wrote {table.num_rows} runs and {len(drugs)} drugs to "
+        f"{snakemake.output.samplesheet}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
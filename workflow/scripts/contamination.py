@@ -0,0 +1,48 @@
+"""How alignments to the decontamination database are classified, shared by the QC
+scripts that filter contaminants out of the reads.
+"""
+
+import csv
+from enum import Enum
+from typing import Dict, List, Sequence
+
+import pysam
+
+# how the is_contaminant column of the metadata spells True
+TRUE_VALUES = {"true", "1"}
+
+
+class Classification(Enum):
+    Contaminant = "contaminant"
+    Unmaped = "unmapped"
+    Keep = "keep"
+    Other = "other"
+
+
+class Classifier:
+    """Whether each reference in the alignment file is a contaminant, stored in a list
+    indexed by the integer reference ID of the records so classifying a record doesn't
+    have to look up its reference name"""
+
+    def __init__(self, metadata_file: str, references: Sequence[str]):
+        is_contam: Dict[str, bool] = dict()
+        with open(metadata_file, newline="") as fp:
+            for organism, contam, accession in csv.reader(fp, delimiter="\t"):
+                is_contam[accession] = contam.lower() in TRUE_VALUES
+
+        missing = [ref for ref in references if ref not in is_contam]
+        if missing:
+            raise KeyError(
+                f"{len(missing)} reference(s) have no metadata, e.g., {missing[0]}"
+            )
+
+        self.is_contam: List[bool] = [is_contam[ref] for ref in references]
+
+    def classify(self, record: pysam.AlignedSegment) -> Classification:
+        if record.is_unmapped:
+            return Classification.Unmaped
+
+        if self.is_contam[record.reference_id]:
+            return Classification.Contaminant
+
+        return Classification.Keep
@@ -0,0 +1,217 @@
+#!/usr/bin/env bash
+set -xeo pipefail
+
+DEFAULT_THREADS=1
+MONITOR_INTERVAL=1 # seconds between polls of the memory and I/O of each run
+BENCHMARK_HEADER="s\th:m:s\tmax_rss\tmax_vms\tmax_uss\tmax_pss\tio_in\tio_out\tmean_load\tcpu_time"
+
+function usage {
+    echo "usage: drprg_batch.sh -x <DIR> -o <DIR> [OPTIONS] <RUN,READS>..."
+    echo "   "
+    echo "  -x                       : drprg index directory [REQUIRED]"
+    echo "  -o                       : Output directory. Each run's files are written to a subdirectory named after it [REQUIRED]"
+    echo "  -p                       : Options to pass to drprg predict"
+    echo "  -s                       : stage.sh and its arguments, to stage the inputs in a node-local cache"
+    echo "  -t                       : Number of threads [default: $DEFAULT_THREADS]"
+    echo "  -h | --help              : This message"
+}
+
+function parse_args {
+    # positional args
+    runs=()
+
+    # named args
+    while [ "$1" != "" ]; do
+        case "$1" in
+            -x)
+                index="$2"
+                shift
+                ;;
+            -o)
+                outdir="$2"
+                shift
+                ;;
+            -p)
+                predict_opts="$2"
+                shift
+                ;;
+            -s)
+                stage_args="$2"
+                shift
+                ;;
+            -t)
+                threads="$2"
+                shift
+                ;;
+            -h | --help)
+                usage
+                exit
+                ;;             # quit and show usage
+            *) runs+=("$1") ;; # if no match, add it to the positional args
+        esac
+        shift # move to next kv pair
+    done
+
+    # validate required args
+    if [[ -z "${index}" || -z "${outdir}" || "${#runs[@]}" -eq 0 ]]; then
+        echo "Invalid arguments"
+        usage
+        exit 1
+    fi
+
+    # set defaults
+    if [[ -z "$threads" ]]; then
+        threads="$DEFAULT_THREADS"
+    fi
+}
+
+function stage_index {
+    if [[ -n "$stage_args" ]]; then
+        # shellcheck disable=SC1090,SC2086
+        source $stage_args
+    fi
+
+    if [[ -n "${STAGE_DIR:-}" ]]; then
+        stage "$index" local_index
+        return
+    fi
+
+    # without a node-local cache, copy the index to the node's local disk once for the
+    # batch, so the runs don't each read it from the network filesystem
+    staging_dir=$(mktemp -d)
+    trap 'rm -rf -- "$staging_dir"' EXIT
+    cp -r "$index" "${staging_dir}/"
+    local_index="${staging_dir}/$(basename "$index")"
+}
+
+function tree_pids {
+    # the PIDs of $1 and all of its descendants
+    local -A children=()
+    local stat line pid ppid
+    for stat in /proc/[0-9]*/stat; do
+        { read -r line < "$stat"; } 2> /dev/null || continue
+        pid="${line%% *}"
+        # the command name is in parentheses and can contain spaces
+        read -r _ ppid _ <<< "${line##*) }"
+        children[$ppid]+=" $pid"
+    done
+
+    local queue=("$1")
+    while [[ "${#queue[@]}" -gt 0 ]]; do
+        pid="${queue[0]}"
+        queue=("${queue[@]:1}")
+        echo "$pid"
+        # shellcheck disable=SC2206
+        queue+=(${children[$pid]:-})
+    done
+}
+
+function monitor {
+    # poll the process tree of $1 until it exits, as snakemake's benchmark directive
+    # does with psutil, and print the max_rss, max_vms, max_uss, max_pss, io_in, and
+    # io_out columns of its benchmark record, in MB. the I/O of each process is its last
+    # reading, so processes that exit before the tree does are still counted
+    set +xe
+    local root="$1"
+    local -A read_bytes=() write_bytes=()
+    local max_rss=0 max_vms=0 max_uss=0 max_pss=0 sampled=0
+    local rss vms uss pss pid key value
+    while kill -0 "$root" 2> /dev/null; do
+        rss=0 vms=0 uss=0 pss=0
+        for pid in $(tree_pids "$root"); do
+            while read -r key value _; do
+                case "$key" in
+                    VmRSS:) rss=$((rss + value)) ;;
+                    VmSize:) vms=$((vms + value)) ;;
+                esac
+            done 2> /dev/null < "/proc/${pid}/status"
+            while read -r key value _; do
+                case "$key" in
+                    Pss:) pss=$((pss + value)) ;;
+                    Private_Clean: | Private_Dirty:) uss=$((uss + value)) ;;
+                esac
+            done 2> /dev/null < "/proc/${pid}/smaps_rollup"
+            while read -r key value; do
+                case "$key" in
+                    read_bytes:) read_bytes[$pid]="$value" ;;
+                    write_bytes:) write_bytes[$pid]="$value" ;;
+                esac
+            done 2> /dev/null < "/proc/${pid}/io"
+        done
+        sampled=1
+        ((rss > max_rss)) && max_rss="$rss"
+        ((vms > max_vms)) && max_vms="$vms"
+        ((uss > max_uss)) && max_uss="$uss"
+        ((pss > max_pss)) && max_pss="$pss"
+        sleep "$MONITOR_INTERVAL"
+    done
+
+    if [[ "$sampled" -eq 0 || "$max_rss" -eq 0 ]]; then
+        printf "NA\tNA\tNA\tNA\tNA\tNA\n"
+        return
+    fi
+    local io_in=0 io_out=0
+    for value in "${read_bytes[@]}"; do
+        io_in=$((io_in + value))
+    done
+    for value in "${write_bytes[@]}"; do
+        io_out=$((io_out + value))
+    done
+    awk -v rss="$max_rss" -v vms="$max_vms" -v uss="$max_uss" -v pss="$max_pss" \
+        -v io_in="$io_in" -v io_out="$io_out" 'BEGIN {
+            kb = 1024; mb = 1024 * 1024
+            printf "%.2f\t%.2f\t%.2f\t%.2f\t%.2f\t%.2f\n", rss / kb, vms / kb, uss / kb, pss / kb, io_in / mb, io_out / mb
+        }'
+}
+
+function run {
+    parse_args "$@"
+    mkdir -p "$outdir"
+    stage_index
+
+    # the same fields as a snakemake benchmark file. the times come from bash's time, and
+    # the memory and I/O from polling the run's processes
+    TIMEFORMAT=$'%3R\t%3U\t%3S'
+
+    for entry in "${runs[@]}"; do
+        IFS=',' read -r run_acc reads <<< "$entry"
+        if [[ -n "${STAGE_DIR:-}" ]]; then
+            stage "$reads" staged_reads
+        else
+            staged_reads="$reads"
+        fi
+        run_dir="${outdir}/${run_acc}"
+        mkdir -p "${run_dir}/drprg"
+
+        # shellcheck disable=SC2086
+        { time drprg predict $predict_opts --sample "$run_acc" -i "$staged_reads" \
+            -o "${run_dir}/drprg" -x "$local_index" -t "$threads" \
+            2> "${run_dir}/drprg.log"; } 2> "${run_dir}/time.tsv" &
+        job=$!
+        monitor "$job" > "${run_dir}/usage.tsv" &
+        monitor_job=$!
+        if ! wait "$job"; then
+            cat "${run_dir}/drprg.log" >&2
+            exit 1
+        fi
+        wait "$monitor_job"
+
+        # the timings are the last line, after the trace of the timed command
+        IFS=$'\t' read -r wall user sys < <(tail -n 1 "${run_dir}/time.tsv")
+        IFS=$'\t' read -r max_rss max_vms max_uss max_pss io_in io_out < "${run_dir}/usage.tsv"
+        rm "${run_dir}/time.tsv" "${run_dir}/usage.tsv"
+        hms=$(awk -v s="$wall" 'BEGIN { printf "%d:%02d:%02d", s / 3600, (s % 3600) / 60, s % 60 }')
+        cpu_time=$(awk -v u="$user" -v s="$sys" 'BEGIN { printf "%.2f", u + s }')
+        # snakemake's mean load is the CPU seconds per second of wall time, as a percentage
+        mean_load=$(awk -v c="$cpu_time" -v s="$wall" 'BEGIN { printf "%.2f", (s > 0 ? 100 * c / s : 0) }')
+        printf "%b\n%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" "$BENCHMARK_HEADER" \
+            "$wall" "$hms" "$max_rss" "$max_vms" "$max_uss" "$max_pss" "$io_in" \
+            "$io_out" "$mean_load" "$cpu_time" > "${run_dir}/benchmark.tsv"
+
+        if [[ -n "${STAGE_DIR:-}" ]]; then
+            unstage "$reads"
+        fi
+    done
+}
+
+run "$@"
@@ -0,0 +1,57 @@
+#!/usr/bin/env bash
+set -euxo pipefail
+
+# shellcheck disable=SC2154
+exec 2> "${snakemake_log[0]}" # send all stderr from this script to the log file
+
+# indexes are cached by the contents of the inputs they are built from, the build
+# options, and the drprg version. a rerun of the rule because an input was touched or
+# regenerated without changing reuses the index rather than rebuilding it
+# shellcheck disable=SC2154
+cache="${snakemake_params[cache]}"
+outdir="${snakemake_output[outdir]}"
+# shellcheck disable=SC2154
+options="${snakemake_params[options]} -l ${snakemake_params[match_len]} -P ${snakemake_params[padding]}"
+
+key=$(
+    {
+        drprg --version
+        echo "$options"
+        for name in panel rules vcf ref annotation; do
+            printf '%s\t' "$name"
+            sha256sum < "${snakemake_input[$name]}"
+        done
+    } | sha256sum | cut -c 1-16
+)
+entry="${cache}/${key}"
+
+if [[ ! -e "$entry" ]]; then
+    mkdir -p "$cache"
+    tmp=$(mktemp -d "${cache}/.tmp.XXXXXX")
+    trap 'rm -rf -- "$tmp"' EXIT
+
+    # shellcheck disable=SC2086
+    drprg build $options -a "${snakemake_input[annotation]}" -o "${tmp}/index" \
+        -i "${snakemake_input[panel]}" -f "${snakemake_input[ref]}" \
+        -t "${snakemake[threads]}" -b "${snakemake_input[vcf]}" \
+        -r "${snakemake_input[rules]}"
+
+    # a rename within the cache, so an entry appears complete or not at all. if another
+    # job published the same index first, this copy is discarded
+    mv -T "${tmp}/index" "$entry" || echo "$entry was published by another job" >&2
+    echo "Cached index at $entry" >&2
+else
+    echo "Using cached index $entry" >&2
+fi
+
+# hard links when the cache is on the same filesystem as the output, otherwise a copy.
+# drprg predict only reads the index, so the cached files are never modified through
+# the links
+rm -rf -- "$outdir"
+if ! cp -al "$entry" "$outdir"; then
+    rm -rf -- "$outdir"
+    cp -a "$entry" "$outdir"
+fi
+# the cached files are older than the inputs that were just touched, which snakemake
+# would otherwise take as the index being out of date
+find "$outdir" -exec touch -h {} +
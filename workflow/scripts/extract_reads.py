@@ -0,0 +1,95 @@
+"""Extract the reads to keep from a fastq, as given by the bitmap filter_contamination.py
+writes, along with the stats seqkit stats would report for the reads written. The
+reads are read once, in order, and are never looked up by their identifier.
+"""
+
+import gzip
+import logging
+import sys
+from itertools import groupby
+from pathlib import Path
+
+import click
+import pysam
+
+from fastq_stats import FastqStats
+
+
+def pair_name(name: str) -> str:
+    """The name the mappers give a read, and the mate it is paired with if the fastq is
+    interleaved"""
+    if name.endswith("/1") or name.endswith("/2"):
+        return name[:-2]
+    return name
+
+
+def is_set(bitmap: bytes, i: int) -> bool:
+    byte = i >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << (i & 7)))
+
+
+@click.command()
+@click.help_option("--help", "-h")
+@click.option(
+    "-i",
+    "--fastq",
+    help="The fastq that was mapped to the decontamination database.",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+)
+@click.option(
+    "-b",
+    "--bitmap",
+    help="The bitmap of the reads to keep, from filter_contamination.py.",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+)
+@click.option(
+    "-s",
+    "--stats",
+    help="File to write the seqkit-style stats of the kept reads to.",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+)
+@click.option(
+    "-n",
+    "--name",
+    help="Name to give the fastq in the stats file [default: stdout]",
+)
+@click.option("-v", "--verbose", help="Turns on debug-level logging.", is_flag=True)
+def main(fastq: str, bitmap: str, stats: str, name: str, verbose: bool):
+    """Writes the reads to keep to stdout as fastq. Consecutive records with the same
+    name (ignoring a /1 or /2 suffix) are a read pair and share a position, as they do
+    when mapped with bwa mem -p.
+    """
+    log_level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s]: %(message)s", level=log_level
+    )
+
+    keep = gzip.decompress(Path(bitmap).read_bytes())
+    fq_stats = FastqStats(phred_offset=33)
+    n_reads = 0
+    n_kept = 0
+
+    logging.info("Extracting reads...")
+    with pysam.FastxFile(fastq) as fq:
+        groups = groupby(fq, key=lambda r: pair_name(r.name))
+        for i, (_, group) in enumerate(groups):
+            n_reads += 1
+            if not is_set(keep, i):
+                continue
+
+            n_kept += 1
+            for record in group:
+                sys.stdout.write(str(record) + "\n")
+                fq_stats.add(record.quality.encode())
+
+    logging.info(f"Kept {n_kept} of {n_reads} reads")
+
+    fq_stats.write(stats, name or "-")
+    logging.info(f"Stats for kept reads written to {stats}")
+
+
+if __name__ == "__main__":
+    main()
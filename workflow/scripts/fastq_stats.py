@@ -0,0 +1,115 @@
+"""The summary statistics seqkit stats reports for a fastq, accumulated as the reads are
+written, for the QC scripts that write the reads to keep themselves.
+"""
+
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+STATS_HEADER = [
+    "file",
+    "format",
+    "type",
+    "num_seqs",
+    "sum_len",
+    "min_len",
+    "avg_len",
+    "max_len",
+    "Q1",
+    "Q2",
+    "Q3",
+    "sum_gap",
+    "N50",
+    "Q20(%)",
+    "Q30(%)",
+]
+
+
+class FastqStats:
+    """Accumulates the same summary statistics as `seqkit stats -a` for the reads
+    written, without holding on to the reads"""
+
+    def __init__(self, phred_offset: int = 0):
+        """phred_offset is what the quality scores passed to add are encoded with, e.g.,
+        33 for the quality strings of a fastq, or 0 for raw phred scores"""
+        self.lengths: Counter = Counter()
+        self.q20 = 0
+        self.q30 = 0
+        # the scores below each threshold - deleting them from the qualities leaves the
+        # bases at or above the threshold
+        self.below_q20 = bytes(range(phred_offset, phred_offset + 20))
+        self.below_q30 = bytes(range(phred_offset, phred_offset + 30))
+
+    def add(self, quals: bytes):
+        self.lengths[len(quals)] += 1
+        self.q20 += len(quals.translate(None, self.below_q20))
+        self.q30 += len(quals.translate(None, self.below_q30))
+
+    def _value_at(self, sorted_lengths: List[int], counts: List[int], i: int) -> int:
+        """The length of the i-th (0-based) shortest read"""
+        seen = 0
+        for length, n in zip(sorted_lengths, counts):
+            seen += n
+            if i < seen:
+                return length
+        raise IndexError(i)
+
+    def _median(self, sorted_lengths, counts, start: int, end: int) -> float:
+        """Median of the read lengths in the half-open rank interval [start, end)"""
+        n = end - start
+        if n == 0:
+            return 0.0
+        mid = start + n // 2
+        if n % 2:
+            return float(self._value_at(sorted_lengths, counts, mid))
+        return (
+            self._value_at(sorted_lengths, counts, mid - 1)
+            + self._value_at(sorted_lengths, counts, mid)
+        ) / 2
+
+    def row(self, name: str) -> Dict[str, str]:
+        num_seqs = sum(self.lengths.values())
+        sum_len = sum(length * n for length, n in self.lengths.items())
+        sorted_lengths = sorted(self.lengths)
+        counts = [self.lengths[length] for length in sorted_lengths]
+
+        n50 = 0
+        cumulative = 0
+        for length in reversed(sorted_lengths):
+            cumulative += length * self.lengths[length]
+            if cumulative >= sum_len / 2:
+                n50 = length
+                break
+
+        half = num_seqs // 2
+        q1 = self._median(sorted_lengths, counts, 0, half)
+        q2 = self._median(sorted_lengths, counts, 0, num_seqs)
+        q3 = self._median(sorted_lengths, counts, num_seqs - half, num_seqs)
+
+        return {
+            "file": name,
+            "format": "FASTQ",
+            "type": "DNA",
+            "num_seqs": str(num_seqs),
+            "sum_len": str(sum_len),
+            "min_len": str(sorted_lengths[0] if num_seqs else 0),
+            "avg_len": f"{sum_len / num_seqs if num_seqs else 0:.1f}",
+            "max_len": str(sorted_lengths[-1] if num_seqs else 0),
+            "Q1": f"{q1:.1f}",
+            "Q2": f"{q2:.1f}",
+            "Q3": f"{q3:.1f}",
+            "sum_gap": "0",
+            "N50": str(n50),
+            "Q20(%)": f"{100 * self.q20 / sum_len if sum_len else 0:.2f}",
+            "Q30(%)": f"{100 * self.q30 / sum_len if sum_len else 0:.2f}",
+        }
+
+    def write(self, path: str, name: str):
+        """Write the stats as the tab-delimited table seqkit stats -a -T writes"""
+        row = self.row(name)
+        Path(path).write_text(
+            "\t".join(STATS_HEADER)
+            + "\n"
+            + "\t".join(row[c] for c in STATS_HEADER)
+            + "\n"
+        )
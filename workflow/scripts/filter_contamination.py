@@ -1,13 +1,20 @@
+import gzip
+import json
 import logging
-from enum import Enum
+from itertools import groupby
 from pathlib import Path
-from typing import Set
+from typing import Dict, Optional, Set
 
 import click
-import pandas as pd
 import pysam
 
-IS_CONTAM_COL = "is_contaminant"
+from contamination import Classification, Classifier
+
+COUNTS_FILENAME = "classification.json"
+BITMAP_FILENAME = "keep.bitmap"
+# the tag map_to_decontam_db.sh adds to each record with the (0-based) position of its
+# read (pair) in the fastq that was mapped
+ORDINAL_TAG = "XO"
 
 
 class RequiredIf(click.Option):
@@ -34,33 +41,177 @@ class RequiredIf(click.Option):
         return super(RequiredIf, self).handle_parse_result(ctx, opts, args)
 
 
-class Classification(Enum):
-    Contaminant = "contaminant"
-    Unmaped = "unmapped"
-    Keep = "keep"
-    Other = "other"
+class Bitmap:
+    """A bit for each read (pair), by its position in the mapped fastq, which is set if
+    the read is to be kept. Bit i is bit i % 8 (least significant first) of byte i // 8
+    """
+
+    def __init__(self):
+        self.bits = bytearray()
+
+    def add(self, i: int):
+        byte = i >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << (i & 7)
+
+    def write(self, path: Path):
+        path.write_bytes(gzip.compress(bytes(self.bits)))
 
 
-class Classifier:
-    def __init__(self, metadata_file: str):
-        self.metadata = pd.read_table(
-            metadata_file,
-            header=None,
-            names=["organism", IS_CONTAM_COL, "accession"],
-            index_col="accession",
-            dtype={IS_CONTAM_COL: "bool"},
+def ordinal(record: pysam.AlignedSegment) -> int:
+    try:
+        return record.get_tag(ORDINAL_TAG)
+    except KeyError:
+        raise KeyError(
+            f"{record.query_name} has no {ORDINAL_TAG} tag with its position in the "
+            f"fastq. Was it mapped with map_to_decontam_db.sh?"
         )
 
-    def classify(self, record: pysam.AlignedSegment) -> Classification:
-        if record.is_unmapped:
-            return Classification.Unmaped
 
-        ref_id = record.reference_name
-        is_contam: bool = self.metadata.at[ref_id, IS_CONTAM_COL]
-        if is_contam:
-            return Classification.Contaminant
+def id_files(outdir: Path, all_ids: bool) -> Dict[Classification, Optional[Path]]:
+    """Where to write the read identifiers of each classification. None if they aren't
+    to be written"""
+    files = {
+        Classification.Keep: outdir / "keep.reads.gz",
+        Classification.Contaminant: outdir / "contaminant.reads.gz",
+        Classification.Unmaped: outdir / "unmapped.reads.gz",
+    }
+    if not all_ids:
+        files = {classification: None for classification in files}
+
+    return files
+
+
+def classify(
+    bam: pysam.AlignmentFile,
+    classifier: Classifier,
+    files: Dict[Classification, Optional[Path]],
+    keep_bitmap: Bitmap,
+    ignore_secondary: bool,
+) -> Dict[Classification, int]:
+    """Classify the reads of an alignment file in any order. The read identifiers are
+    held in memory until all records have been seen"""
+    ordinals: Dict[str, int] = dict()
+    all_read_ids: Set[str] = set()
+    unmapped_reads: Set[str] = set()
+    contaminant_reads: Set[str] = set()
+    keep_reads: Set[str] = set()
+
+    for record in bam:
+        read_id = record.query_name
+        if read_id is None:
+            logging.warning(f"Got a record with no query name\n{str(record)}")
+            continue
+
+        all_read_ids.add(read_id)
+        if read_id not in ordinals:
+            ordinals[read_id] = ordinal(record)
+        if record.is_secondary and ignore_secondary:
+            logging.debug(f"{read_id} has secondary alignment. Skipping...")
+            continue
+
+        classification = classifier.classify(record)
+        if classification is Classification.Unmaped:
+            unmapped_reads.add(read_id)
+        elif classification is Classification.Keep:
+            keep_reads.add(read_id)
+        elif classification is Classification.Contaminant:
+            contaminant_reads.add(read_id)
+        else:
+            raise NotImplementedError(
+                f"Don't know how to handle classification: {classification}"
+            )
+
+    # if any read in the pair is a "keeper" remove it from contaminants
+    contaminant_reads -= keep_reads
+    # reads are only unmapped if both are unmapped
+    unmapped_reads -= keep_reads.union(contaminant_reads)
+
+    assert all_read_ids == keep_reads.union(unmapped_reads, contaminant_reads)
+
+    for read_id in keep_reads:
+        keep_bitmap.add(ordinals[read_id])
+
+    logging.info("Writing output files...")
+    for classification, read_ids in [
+        (Classification.Keep, keep_reads),
+        (Classification.Contaminant, contaminant_reads),
+        (Classification.Unmaped, unmapped_reads),
+    ]:
+        path = files[classification]
+        if path is None:
+            continue
+        with gzip.open(path, "wt") as fp:
+            for read_id in read_ids:
+                print(read_id, file=fp)
+        logging.info(f"{classification.value} read identifiers written to {path}")
+
+    return {
+        Classification.Keep: len(keep_reads),
+        Classification.Contaminant: len(contaminant_reads),
+        Classification.Unmaped: len(unmapped_reads),
+    }
 
-        return Classification.Keep
+
+def classify_name_grouped(
+    bam: pysam.AlignmentFile,
+    classifier: Classifier,
+    files: Dict[Classification, Optional[Path]],
+    keep_bitmap: Bitmap,
+    ignore_secondary: bool,
+) -> Dict[Classification, int]:
+    """Classify the reads of an alignment file whose records are grouped by read name,
+    e.g., by samtools collate. A read (pair) is resolved as soon as its group of records
+    ends and written straight out, so memory use doesn't grow with the number of reads.
+    Reads whose records are not together in the input would be written more than once
+    """
+    n_reads = {classification: 0 for classification in files}
+    fps = {
+        classification: gzip.open(path, "wt")
+        for classification, path in files.items()
+        if path is not None
+    }
+
+    try:
+        for read_id, group in groupby(bam, key=lambda r: r.query_name):
+            if read_id is None:
+                logging.warning("Got record(s) with no query name. Skipping...")
+                continue
+
+            classifications = set()
+            i = None
+            for record in group:
+                if i is None:
+                    i = ordinal(record)
+                if record.is_secondary and ignore_secondary:
+                    logging.debug(f"{read_id} has secondary alignment. Skipping...")
+                    continue
+                classifications.add(classifier.classify(record))
+
+            # if any read in the pair is a "keeper" it is not a contaminant, and reads
+            # are only unmapped if both are unmapped
+            if Classification.Keep in classifications:
+                classification = Classification.Keep
+            elif Classification.Contaminant in classifications:
+                classification = Classification.Contaminant
+            else:
+                classification = Classification.Unmaped
+
+            if classification is Classification.Keep:
+                keep_bitmap.add(i)
+            if classification in fps:
+                print(read_id, file=fps[classification])
+            n_reads[classification] += 1
+    finally:
+        for fp in fps.values():
+            fp.close()
+
+    for classification, path in files.items():
+        if path is not None:
+            logging.info(f"{classification.value} read identifiers written to {path}")
+
+    return n_reads
 
 
 @click.command()
@@ -69,7 +220,7 @@ class Classifier:
     "-i",
     "--samfile",
     help="{B,CR,S}AM file of reads mapped to decontamination database.",
-    type=click.Path(exists=True, dir_okay=False),
+    type=click.Path(exists=True, dir_okay=False, allow_dash=True),
     required=True,
 )
 @click.option(
@@ -89,7 +240,8 @@ class Classifier:
     type=click.Path(dir_okay=True, writable=True),
     help=(
         "Directory to write the output files to. The files written will be named "
-        "unmapped.reads, contaminant.reads, and keep.reads"
+        "keep.bitmap, classification.json, and, unless --no-ids, unmapped.reads.gz, "
+        "contaminant.reads.gz, and keep.reads.gz"
     ),
     default=".",
     show_default=True,
@@ -100,16 +252,54 @@ class Classifier:
     default=True,
     show_default=True,
 )
+@click.option(
+    "--ids/--no-ids",
+    "all_ids",
+    help=(
+        "Write the identifiers of the reads to keep, contaminant reads, and unmapped "
+        "reads? The reads to keep are always recorded in the bitmap"
+    ),
+    default=True,
+    show_default=True,
+)
+@click.option(
+    "--name-grouped",
+    help=(
+        "The records in the input are grouped by read name (e.g., from samtools "
+        "collate). Each read is classified and written as soon as its records have "
+        "been seen, rather than holding all read identifiers in memory."
+    ),
+    is_flag=True,
+)
+@click.option(
+    "-@",
+    "--threads",
+    help="Number of threads to use for decompressing BAM/CRAM input.",
+    type=int,
+    default=1,
+    show_default=True,
+)
 @click.option("-v", "--verbose", help="Turns on debug-level logging.", is_flag=True)
 def main(
-    samfile: str, metadata: str, outdir: str, ignore_secondary: bool, verbose: bool,
+    samfile: str,
+    metadata: str,
+    outdir: str,
+    ignore_secondary: bool,
+    all_ids: bool,
+    name_grouped: bool,
+    threads: int,
+    verbose: bool,
 ):
     """This scripts classifies records in an alignment to a contamination database, with
     the help of a metadata file mapping reference names to whether they are
-    contamination or not. It produces three files with a read identifier for each line:
+    contamination or not. It produces
+      - keep.bitmap: a (gzipped) bitmap of the reads to keep, by their position in the
+        fastq that was mapped
+      - classification.json: the number of reads of each kind
+    and, unless --no-ids, (gzipped) files with a read identifier on each line for
+      - reads to keep
       - unmapped reads
       - contaminated reads
-      - reads to keep
     """
     log_level = logging.DEBUG if verbose else logging.INFO
     logging.basicConfig(
@@ -118,60 +308,31 @@ def main(
     outdir = Path(outdir)
     outdir.mkdir(exist_ok=True)
 
-    classifier = Classifier(metadata)
-    all_read_ids: Set[str] = set()
-    unmapped_reads: Set[str] = set()
-    contaminant_reads: Set[str] = set()
-    keep_reads: Set[str] = set()
-
     logging.info("Classifying records in alignment file...")
-    with pysam.AlignmentFile(samfile) as bam:
-        for record in bam:
-            read_id = record.query_name
-            if read_id is None:
-                logging.warning(f"Got a record with no query name\n{str(record)}")
-                continue
-
-            all_read_ids.add(read_id)
-            if record.is_secondary and ignore_secondary:
-                logging.debug(f"{read_id} has secondary alignment. Skipping...")
-                continue
-
-            classification = classifier.classify(record)
-            if classification is Classification.Unmaped:
-                unmapped_reads.add(read_id)
-            elif classification is Classification.Keep:
-                keep_reads.add(read_id)
-            elif classification.Contaminant:
-                contaminant_reads.add(read_id)
-            else:
-                raise NotImplementedError(
-                    f"Don't know how to handle classification: {classification}"
-                )
-
-    # if any read in the pair is a "keeper" remove it from contaminants
-    contaminant_reads -= keep_reads
-    # reads are only unmapped if both are unmapped
-    unmapped_reads -= keep_reads.union(contaminant_reads)
+    with pysam.AlignmentFile(samfile, threads=threads) as bam:
+        classifier = Classifier(metadata, bam.references)
+        files = id_files(outdir, all_ids)
+        keep_bitmap = Bitmap()
+        if name_grouped:
+            n_reads = classify_name_grouped(
+                bam, classifier, files, keep_bitmap, ignore_secondary
+            )
+        else:
+            n_reads = classify(bam, classifier, files, keep_bitmap, ignore_secondary)
 
-    assert all_read_ids == keep_reads.union(unmapped_reads, contaminant_reads)
+    bitmap_file = outdir / BITMAP_FILENAME
+    keep_bitmap.write(bitmap_file)
+    logging.info(f"Bitmap of the reads to keep written to {bitmap_file}")
 
-    logging.info(f"{len(keep_reads)} reads are to be kept")
-    logging.info(f"{len(contaminant_reads)} reads are contaminants")
-    logging.info(f"{len(unmapped_reads)} reads are unmapped")
-    logging.info("Writing output files...")
-
-    keep_file = outdir / "keep.reads"
-    keep_file.write_text("\n".join(keep_reads))
-    logging.info(f"Read identifiers to keep written to {keep_file}")
+    logging.info(f"{n_reads[Classification.Keep]} reads are to be kept")
+    logging.info(f"{n_reads[Classification.Contaminant]} reads are contaminants")
+    logging.info(f"{n_reads[Classification.Unmaped]} reads are unmapped")
 
-    contaminant_file = outdir / "contaminant.reads"
-    contaminant_file.write_text("\n".join(contaminant_reads))
-    logging.info(f"Contaminant read identifiers written to {contaminant_file}")
-
-    unmapped_file = outdir / "unmapped.reads"
-    unmapped_file.write_text("\n".join(unmapped_reads))
-    logging.info(f"Unmapped read identifiers written to {unmapped_file}")
+    counts_file = outdir / COUNTS_FILENAME
+    counts_file.write_text(
+        json.dumps({c.value: n for c, n in n_reads.items()}, indent=2) + "\n"
+    )
+    logging.info(f"Read counts written to {counts_file}")
 
 
 if __name__ == "__main__":
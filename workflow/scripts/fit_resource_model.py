@@ -0,0 +1,113 @@
+import sys
+
+sys.stderr = open(snakemake.log[0], "w")
+
+import csv
+import json
+import math
+import os
+import statistics
+from collections import defaultdict
+from pathlib import Path
+
+MB = 1_024 * 1_024
+
+
+def load_benchmarks(paths: list[str], reads_template: str):
+    """Yield the tool, tech, reads size (MB), and benchmark row of each run"""
+    for path in map(Path, paths):
+        # .../predict/{tool}/{tech}/{proj}/{sample}/{run}.tsv
+        tool, tech, proj, sample = path.parts[-5:-1]
+        run = path.stem
+        reads = reads_template.format(tech=tech, proj=proj, sample=sample, run=run)
+        try:
+            size = os.stat(reads).st_size / MB
+        except FileNotFoundError:
+            print(f"No reads for {run} at {reads}. Skipping...", file=sys.stderr)
+            continue
+
+        with open(path) as fp:
+            for row in csv.DictReader(fp, delimiter="\t"):
+                yield tool, tech, size, row
+
+
+def as_float(value: str) -> float:
+    """Benchmark fields are '-' or NA when they couldn't be measured"""
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def fit_linear(xs: list[float], ys: list[float], quantile: float) -> dict:
+    """A least-squares fit of y on x, with a margin so that the given quantile of the
+    observed values are at or below the prediction"""
+    if len(set(xs)) > 1:
+        slope, intercept = statistics.linear_regression(xs, ys)
+    else:
+        slope, intercept = 0.0, statistics.fmean(ys)
+
+    residuals = [y - (intercept + slope * x) for x, y in zip(xs, ys)]
+    margin = max(0.0, statistics.quantiles(residuals, n=100)[int(quantile * 100) - 1])
+    return {
+        "intercept": intercept,
+        "slope": slope,
+        "margin": margin,
+        "n": len(xs),
+    }
+
+
+def main():
+    quantile = snakemake.params.quantile
+    min_runs = snakemake.params.min_runs
+    max_threads = snakemake.params.max_threads
+
+    obs = defaultdict(lambda: defaultdict(list))
+    for tool, tech, size, row in load_benchmarks(
+        snakemake.input.bench, snakemake.params.reads
+    ):
+        s = as_float(row["s"])
+        max_rss = as_float(row["max_rss"])
+        cpu_time = as_float(row["cpu_time"])
+        if not math.isnan(s):
+            obs[(tool, tech)]["runtime"].append((size, s / 60))
+        if not math.isnan(max_rss):
+            obs[(tool, tech)]["mem_mb"].append((size, max_rss))
+        if not math.isnan(cpu_time) and s > 0:
+            obs[(tool, tech)]["threads"].append(cpu_time / s)
+
+    model = defaultdict(dict)
+    for (tool, tech), kinds in sorted(obs.items()):
+        fits = dict()
+        for kind in ("mem_mb", "runtime"):
+            points = kinds[kind]
+            if len(points) < min_runs:
+                print(
+                    f"Only {len(points)} {kind} measurements for {tool} {tech}. "
+                    f"Skipping...",
+                    file=sys.stderr,
+                )
+                continue
+            xs, ys = zip(*points)
+            fits[kind] = fit_linear(list(xs), list(ys), quantile)
+
+        loads = kinds["threads"]
+        if len(loads) >= min_runs:
+            # the number of cores the tool keeps busy for most runs
+            load = statistics.quantiles(loads, n=100)[int(quantile * 100) - 1]
+            fits["threads"] = {
+                "value": min(max_threads, max(1, math.ceil(load))),
+                "n": len(loads),
+            }
+
+        if fits:
+            model[tool][tech] = fits
+            print(f"Fitted {tool} {tech}: {fits}", file=sys.stderr)
+
+    with open(snakemake.output.model, "w") as fp:
+        json.dump(model, fp, indent=2)
+        print(file=fp)
+
+
+if __name__ == "__main__":
+    main()
@@ -80,6 +80,15 @@ function parse_args {
     fi
 }
 
+# tag each record with the position (0-based) of its read (pair) in the input fastq.
+# the mappers write the records in input order, and all of a read's records together
+function add_ordinal_tag {
+    awk 'BEGIN { OFS = "\t"; i = -1 }
+        /^@/ { print; next }
+        $1 != prev { i++; prev = $1 }
+        { print $0, "XO:i:" i }'
+}
+
 function run {
     parse_args "$@"
 
@@ -93,6 +102,7 @@ function run {
         fi
 
         bwa mem ${args[*]} -t "$threads" "$db" "$reads" |
+            add_ordinal_tag |
             samtools sort -n -@ "$threads" |
             samtools fixmate -m -@ "$threads" - - |
             samtools sort -@ "$threads" |
@@ -100,6 +110,7 @@ function run {
 
     else
         minimap2 ${args[*]} -t "$threads" "$db" "$reads" |
+            add_ordinal_tag |
             samtools sort -@ "$threads" -o "$output"
     fi
 
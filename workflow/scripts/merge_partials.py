@@ -0,0 +1,106 @@
+import sys
+
+sys.stderr = open(snakemake.log[0], "w")
+
+import shutil
+from pathlib import Path
+from typing import Optional
+
+# the columns that are partition keys of the parquet dataset, rather than stored in it
+PARTITION_COLUMNS = ("technology", "tool")
+BATCH_ROWS = 100_000  # number of rows to read from a partial at a time
+
+if str(snakemake.output[0]).endswith("csv"):
+    DELIM = ","
+elif str(snakemake.output[0]).endswith("tsv"):
+    DELIM = "\t"
+else:
+    raise NotImplementedError("Don't know output delimiter")
+
+
+def eprint(msg):
+    print(msg, file=sys.stderr)
+
+
+def write_dataset(partials: list[str], root: Path, partition_key: Optional[str]):
+    """Write the rows of the partials to a hive-partitioned parquet dataset, in the
+    same layout combine_reports.py writes"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pcsv
+    import pyarrow.parquet as pq
+
+    root.mkdir(parents=True, exist_ok=True)
+    writers = dict()
+    for partial in partials:
+        with open(partial) as fp:
+            first = fp.readline()
+        if not first:
+            continue
+        columns = first.rstrip("\n").split(DELIM)
+        keep = [c for c in columns if c not in (*PARTITION_COLUMNS, partition_key)]
+        schema = pa.schema([(c, pa.string()) for c in keep])
+
+        reader = pcsv.open_csv(
+            partial,
+            read_options=pcsv.ReadOptions(block_size=1 << 24),
+            # the summaries are written without quoting
+            parse_options=pcsv.ParseOptions(delimiter=DELIM, quote_char=False),
+            convert_options=pcsv.ConvertOptions(
+                column_types={c: pa.string() for c in columns}
+            ),
+        )
+        for batch in reader:
+            table = pa.Table.from_batches([batch])
+            if partition_key is None:
+                parts = {"": table}
+            else:
+                parts = {
+                    value: table.filter(pc.equal(table[partition_key], value))
+                    for value in pc.unique(table[partition_key]).to_pylist()
+                }
+
+            for value, part in parts.items():
+                if value not in writers:
+                    outdir = root
+                    if partition_key is not None:
+                        outdir /= f"{partition_key}={value}"
+                    outdir.mkdir(parents=True, exist_ok=True)
+                    writers[value] = pq.ParquetWriter(
+                        outdir / "part-0.parquet", schema, compression="zstd"
+                    )
+                writers[value].write_table(part.select(keep))
+
+    for writer in writers.values():
+        writer.close()
+
+
+def main():
+    partials = list(map(str, snakemake.input.partials))
+    header = None
+
+    # the partials are concatenated as they are, without parsing the rows
+    with open(snakemake.output[0], "w") as fout:
+        for partial in partials:
+            with open(partial) as fin:
+                first = fin.readline()
+                if not first:
+                    continue
+                if header is None:
+                    header = first
+                    fout.write(header)
+                elif first != header:
+                    raise ValueError(
+                        f"The header of {partial} differs from the other partials"
+                    )
+                shutil.copyfileobj(fin, fout)
+
+    dataset_root = getattr(snakemake.output, "dataset", None)
+    if dataset_root is not None:
+        write_dataset(partials, Path(dataset_root), snakemake.params.partition_key)
+
+    eprint(f"Merged {len(partials)} partials into {snakemake.output[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,19 +5,25 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import upsetplot
 import pandas as pd
+import pyarrow.parquet as pq
 import numpy as np
 
 plt.style.use("ggplot")
 
 
 def main():
-    samplesheet = snakemake.params.samplesheet
-
     drop_cols = {"biosample", "bioproject"}
-    DRUGS = set(samplesheet.drop(columns=drop_cols).columns)
+    columns = [
+        c for c in pq.read_schema(snakemake.input.samplesheet).names if c not in drop_cols
+    ]
+    samplesheet = (
+        pd.read_parquet(snakemake.input.samplesheet, columns=columns)
+        .set_index("run")
+        .astype(object)
+    )
+    DRUGS = set(samplesheet.columns)
     pheno_df = (
-        samplesheet.drop(columns=drop_cols)
-        .melt(ignore_index=False, var_name="drug", value_name="phenotype")
+        samplesheet.melt(ignore_index=False, var_name="drug", value_name="phenotype")
         .reset_index()
     )
     d = {}
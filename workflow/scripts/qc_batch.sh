@@ -0,0 +1,187 @@
+#!/usr/bin/env bash
+set -xeo pipefail
+
+DEFAULT_THREADS=1
+SCRIPTS=$(dirname "$(realpath "$0")")
+
+function usage {
+    echo "usage: qc_batch.sh -d <FILE> -m <FILE> -o <DIR> [OPTIONS] <RUN,READS,RUN_INFO>..."
+    echo "   "
+    echo "  -d                       : Database to map to [REQUIRED]"
+    echo "  -m                       : Decontamination database metadata [REQUIRED]"
+    echo "  -o                       : Output directory. Each run's files are written to a subdirectory named after it [REQUIRED]"
+    echo "  -x                       : Options to pass to map_to_decontam_db.sh"
+    echo "  -f                       : Options to pass to filter_contamination.py"
+    echo "  -t                       : Number of threads [default: $DEFAULT_THREADS]"
+    echo "  -h | --help              : This message"
+}
+
+function parse_args {
+    # positional args
+    runs=()
+
+    # named args
+    while [ "$1" != "" ]; do
+        case "$1" in
+            -d)
+                db="$2"
+                shift
+                ;;
+            -m)
+                metadata="$2"
+                shift
+                ;;
+            -o)
+                outdir="$2"
+                shift
+                ;;
+            -x)
+                map_opts="$2"
+                shift
+                ;;
+            -f)
+                filter_opts="$2"
+                shift
+                ;;
+            -t)
+                threads="$2"
+                shift
+                ;;
+            -h | --help)
+                usage
+                exit
+                ;;             # quit and show usage
+            *) runs+=("$1") ;; # if no match, add it to the positional args
+        esac
+        shift # move to next kv pair
+    done
+
+    # validate required args
+    if [[ -z "${db}" || -z "${metadata}" || -z "${outdir}" || "${#runs[@]}" -eq 0 ]]; then
+        echo "Invalid arguments"
+        usage
+        exit 1
+    fi
+
+    # set defaults
+    if [[ -z "$threads" ]]; then
+        threads="$DEFAULT_THREADS"
+    fi
+}
+
+# bwa shm -d drops every index in shared memory on the node, not only ours. so each
+# job that uses the index records its PID in a file, under a lock, and the index is
+# only dropped by the last of them to exit
+SHM_LOCK="/dev/shm/qc_batch.bwa_shm.$(id -u).lock"
+SHM_USERS="/dev/shm/qc_batch.bwa_shm.$(id -u).users"
+
+function with_shm_lock {
+    (
+        flock 9
+        "$@"
+    ) 9> "$SHM_LOCK"
+}
+
+function live_shm_users {
+    # a job that was killed before it could remove itself is dropped here
+    local pid
+    if [[ ! -f "$SHM_USERS" ]]; then
+        return
+    fi
+    while read -r pid; do
+        if kill -0 "$pid" 2> /dev/null; then
+            echo "$pid"
+        fi
+    done < "$SHM_USERS"
+}
+
+function reap_index {
+    # a batch that was killed (e.g., SIGKILL or OOM) never ran its EXIT trap. if every
+    # batch using the index is dead, the last of them can't drop it, so we do
+    local users
+    users=$(live_shm_users)
+    if [[ ! -f "$SHM_USERS" ]]; then
+        return
+    fi
+    if [[ -z "$users" ]]; then
+        echo "Dropping the bwa index left in shared memory by a batch that was killed"
+        bwa shm -d
+        rm -f "$SHM_USERS"
+    else
+        # shellcheck disable=SC2086
+        printf '%s\n' $users > "$SHM_USERS"
+    fi
+}
+
+function acquire_index {
+    local users
+    users=$(live_shm_users)
+    if bwa shm -l 2> /dev/null | grep -q "$(basename "$db")"; then
+        if [[ ! -f "$SHM_USERS" ]]; then
+            # loaded by something other than a batch. it is left for that to drop
+            echo "bwa index for $db is already in shared memory"
+            return
+        fi
+        echo "bwa index for $db is already in shared memory, loaded by another batch"
+    else
+        bwa shm "$db"
+    fi
+    # shellcheck disable=SC2086
+    printf '%s\n' $users $$ > "$SHM_USERS"
+}
+
+function release_index {
+    local users
+    users=$(live_shm_users | grep -vx "$$" || true)
+    if [[ -z "$users" ]]; then
+        bwa shm -d
+        rm -f "$SHM_USERS"
+    else
+        echo "bwa index for $db is still used by $users"
+        # shellcheck disable=SC2086
+        printf '%s\n' $users > "$SHM_USERS"
+    fi
+}
+
+function load_index {
+    # minimap2 indices are read straight from disk, so after the first run of the batch
+    # the .mmi is served from this node's page cache. bwa's index has to be rebuilt in
+    # memory by every bwa mem call, so we put it in shared memory for the batch and
+    # bwa mem attaches to it instead. any batch cleans up after a killed one, even if
+    # it doesn't use the bwa index itself
+    with_shm_lock reap_index
+    if [[ "$db" == *.mmi ]]; then
+        return
+    fi
+
+    with_shm_lock acquire_index
+    if with_shm_lock grep -qx "$$" "$SHM_USERS" 2> /dev/null; then
+        trap 'with_shm_lock release_index' EXIT
+    fi
+}
+
+function run {
+    parse_args "$@"
+    mkdir -p "$outdir"
+    load_index
+
+    for entry in "${runs[@]}"; do
+        IFS=',' read -r run_acc reads run_info <<< "$entry"
+        run_dir="${outdir}/${run_acc}"
+        bam="${run_dir}/${run_acc}.sorted.bam"
+        mkdir -p "$run_dir"
+
+        # shellcheck disable=SC2086
+        bash "${SCRIPTS}/map_to_decontam_db.sh" -r "$run_acc" -i "$run_info" \
+            -R "$reads" -o "$bam" -d "$db" -t "$threads" $map_opts
+
+        # shellcheck disable=SC2086
+        samtools collate -u -O -@ "$threads" -T "${run_dir}/collate" "$bam" |
+            python "${SCRIPTS}/filter_contamination.py" $filter_opts --name-grouped \
+                -i - -m "$metadata" -o "$run_dir"
+
+        rm -f "$bam" "${bam}.bai"
+    done
+}
+
+run "$@"
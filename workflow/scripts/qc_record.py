@@ -0,0 +1,56 @@
+import sys
+
+sys.stderr = open(snakemake.log[0], "w")
+
+import csv
+import json
+
+
+def main():
+    with open(snakemake.input.counts) as fp:
+        counts = json.load(fp)
+
+    with open(snakemake.input.stats) as fp:
+        stats = list(csv.DictReader(fp, delimiter="\t"))
+    assert len(stats) == 1
+    sum_len = int(stats[0]["sum_len"])
+
+    # a row for each file of the run, e.g., both mates of a pair
+    with open(snakemake.input.raw_stats) as fp:
+        raw_sum_len = sum(
+            int(row["sum_len"]) for row in csv.DictReader(fp, delimiter="\t")
+        )
+
+    n_keep = counts["keep"]
+    n_contam = counts["contaminant"]
+    n_unmapped = counts["unmapped"]
+    N = n_keep + n_contam + n_unmapped
+    if N == 0:
+        f_keep = ""
+        f_contam = ""
+        f_unmapped = ""
+    else:
+        f_keep = n_keep / N
+        f_contam = n_contam / N
+        f_unmapped = n_unmapped / N
+
+    record = {
+        "run": snakemake.wildcards.run,
+        "n_keep": n_keep,
+        "n_contam": n_contam,
+        "n_unmapped": n_unmapped,
+        "f_keep": f_keep,
+        "f_contam": f_contam,
+        "f_unmapped": f_unmapped,
+        "sum_len": sum_len,
+        "coverage": sum_len / snakemake.params.genome_size,
+        "raw_sum_len": raw_sum_len,
+    }
+
+    # a single line, so records can be concatenated into a JSON lines shard
+    with open(snakemake.output.record, "w") as fp:
+        print(json.dumps(record), file=fp)
+
+
+if __name__ == "__main__":
+    main()
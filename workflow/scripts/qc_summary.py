@@ -2,75 +2,99 @@ import sys
 
 sys.stderr = open(snakemake.log[0], "w")
 
-from pathlib import Path
-import pandas as pd
-from multiprocessing import Pool
-
-N = 100  # number of files to process in a single process (chunks)
-
-
-def extract_stats(s, k, c, u):
-    r1 = s.parts[-2]
-    r2 = k.parts[-2]
-    r3 = c.parts[-2]
-    r4 = u.parts[-2]
-    assert r1 == r2 == r3 == r4
-    run = r1
-
-    stats = pd.read_csv(s, sep="\t")
-    sum_lens = list(stats["sum_len"])
-    assert len(sum_lens) == 1
-    sum_len = sum_lens[0]
-
-    cov = sum_len / snakemake.params.genome_size
-
-    with open(k) as fp:
-        n_keep_ids = sum(1 for line in fp)
-
-    with open(c) as fp:
-        n_contam_ids = sum(1 for line in fp)
-
-    with open(u) as fp:
-        n_unmapped_ids = sum(1 for line in fp)
-
-    N = n_unmapped_ids + n_contam_ids + n_keep_ids
-    if N == 0:
-        f_keep = ""
-        f_contam = ""
-        f_unmapped = ""
-    else:
-        f_keep = n_keep_ids / N
-        f_contam = n_contam_ids / N
-        f_unmapped = n_unmapped_ids / N
-
-    return [run, cov, f_keep, f_contam, f_unmapped]
+import csv
+import json
+import os
+import sqlite3
+
+COLUMNS = ["run", "coverage", "f_keep", "f_contam", "f_unmapped"]
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run TEXT PRIMARY KEY,
+    source TEXT NOT NULL REFERENCES sources(path),
+    coverage REAL,
+    f_keep REAL,
+    f_contam REAL,
+    f_unmapped REAL
+);
+CREATE INDEX IF NOT EXISTS runs_source ON runs(source);
+"""
+
+
+def load_records(path: str):
+    """Each source is a JSON lines file of the per-run QC records - either a single
+    record or a shard of them concatenated together"""
+    with open(path) as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield [record[c] if record[c] != "" else None for c in COLUMNS]
+
+
+def update(conn: sqlite3.Connection, paths: list[str]) -> int:
+    """Bring the store up to date with the given sources. Only sources whose size or
+    modification time differ from when they were last loaded are read. Returns the
+    number of sources read"""
+    known = {
+        path: (size, mtime_ns)
+        for path, size, mtime_ns in conn.execute("SELECT * FROM sources")
+    }
+
+    for path in set(known) - set(paths):
+        conn.execute("DELETE FROM runs WHERE source = ?", (path,))
+        conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+
+    n_read = 0
+    for path in paths:
+        st = os.stat(path)
+        if known.get(path) == (st.st_size, st.st_mtime_ns):
+            continue
+
+        conn.execute("DELETE FROM runs WHERE source = ?", (path,))
+        conn.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns),
+        )
+        # a run that moved between sources is replaced rather than duplicated
+        conn.executemany(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+            ([run, path, *values] for run, *values in load_records(path)),
+        )
+        n_read += 1
+
+    return n_read
 
 
 def main():
-    stats_paths = list(map(Path, sorted(snakemake.input.stats)))
-    keep_ids_paths = list(map(Path, sorted(snakemake.input.keep_ids)))
-    contam_ids_paths = list(map(Path, sorted(snakemake.input.contam_ids)))
-    unmapped_ids_paths = list(map(Path, sorted(snakemake.input.unmapped_ids)))
-
-    assert (
-        len(stats_paths)
-        == len(keep_ids_paths)
-        == len(contam_ids_paths)
-        == len(unmapped_ids_paths)
-    )
-
-    it = list(zip(stats_paths, keep_ids_paths, contam_ids_paths, unmapped_ids_paths))
-
-    data = [["run", "coverage", "f_keep", "f_contam", "f_unmapped"]]
-
-    with Pool(snakemake.threads) as pool:
-        rows = pool.starmap(extract_stats, it, chunksize=N)
-
-    data.extend(rows)
-
-    with open(snakemake.output.summary, "w") as fp:
-        for row in data:
-            print(",".join(map(str, row)), file=fp)
+    paths = sorted(map(str, snakemake.input.records))
+
+    conn = sqlite3.connect(snakemake.params.store)
+    try:
+        with conn:
+            conn.executescript(SCHEMA)
+            n_read = update(conn, paths)
+        print(f"Read {n_read} of {len(paths)} QC record sources", file=sys.stderr)
+
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM runs ORDER BY source, rowid"
+        )
+        with open(snakemake.output.summary, "w", newline="") as fp:
+            writer = csv.writer(fp, lineterminator="\n")
+            writer.writerow(COLUMNS)
+            n_runs = 0
+            for row in rows:
+                writer.writerow(["" if x is None else x for x in row])
+                n_runs += 1
+    finally:
+        conn.close()
+
+    print(f"Exported {n_runs} runs to {snakemake.output.summary}", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+import sys
+
+sys.stderr = open(snakemake.log[0], "w")
+
+import csv
+import json
+import math
+from collections import Counter
+from pathlib import Path
+
+from classification import Classifier, Prediction
+
+
+def load_phenotypes(path: str) -> dict[tuple[str, str], Prediction]:
+    """The R/S phenotypes of each sample and drug, as in plot_wk_results.py - line probe
+    assay phenotypes and anything other than R or S are ignored"""
+    phenotypes = dict()
+    with open(path) as fp:
+        for row in csv.DictReader(fp):
+            sample = row.pop("sample")
+            for drug, ph in row.items():
+                if drug.lower().endswith("-lpa") or ph.upper() not in ("R", "S"):
+                    continue
+                phenotypes[(sample, drug.lower())] = Prediction(ph.upper())
+
+    return phenotypes
+
+
+def main():
+    phenotypes = load_phenotypes(snakemake.input.phenotypes)
+    classifier = Classifier(
+        minor_is_susceptible=snakemake.params.minor_is_susceptible,
+        unknown_is_resistant=snakemake.params.unknown_is_resistant,
+        failed_is_resistant=snakemake.params.failed_is_resistant,
+    )
+
+    counts = dict()
+    samples = set()
+    for report_path in map(Path, snakemake.input.reports):
+        sample = report_path.parts[-2]
+        k = int(report_path.parts[-4][1:])
+        w = int(report_path.parts[-5][1:])
+        samples.add(sample)
+        clfs = counts.setdefault((w, k), Counter())
+
+        with open(report_path) as fp:
+            data = json.load(fp)
+
+        for drug, results in data["susceptibility"].items():
+            truth = phenotypes.get((sample, drug.lower()))
+            if drug == "NONE" or truth is None:
+                continue
+            pred = Prediction(results["predict"])
+            clfs[str(classifier.from_predictions(truth, pred))] += 1
+
+    # lowest FN + FP first, with fewer FNs breaking ties
+    ranked = sorted(
+        counts.items(), key=lambda item: (item[1]["FN"] + item[1]["FP"], item[1]["FN"])
+    )
+    n_advance = math.ceil(len(ranked) / snakemake.params.eta)
+    print(
+        f"Advancing {n_advance} of {len(ranked)} combinations, evaluated on "
+        f"{len(samples)} samples",
+        file=sys.stderr,
+    )
+
+    with open(snakemake.output.scores, "w", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["w", "k", "n_samples", "FN", "FP", "score", "advance"])
+        for i, ((w, k), clfs) in enumerate(ranked):
+            fn = clfs["FN"]
+            fp_ = clfs["FP"]
+            writer.writerow([w, k, len(samples), fn, fp_, fn + fp_, i < n_advance])
+
+
+if __name__ == "__main__":
+    main()
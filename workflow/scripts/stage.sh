@@ -0,0 +1,122 @@
+#!/usr/bin/env bash
+# Stage inputs on node-local scratch, in a cache shared by all jobs on the node. Source
+# this script, then stage each input
+#
+#   source stage.sh <MAX_GB> [CACHE_DIR]
+#   stage <PATH> <VAR>
+#
+# which sets the variable VAR to the path of the staged copy of the file or directory
+# PATH. If no cache directory is given, nothing is staged and VAR is set to PATH. A job
+# that is finished with an input before it exits can release it with `unstage <PATH>`.
+#
+# An entry is keyed by a hash of the input's path and the size and modification time of
+# each of its files, so it is refreshed when the input changes. Hashing the contents
+# would mean reading the input over the network for every job, which is what the cache
+# is avoiding. A job holds a shared lock on each entry it stages until it exits, so an
+# entry is never evicted while it is in use. Once the cache is bigger than MAX_GB, the
+# least recently used entries that are not in use are evicted.
+
+STAGE_MAX_GB="${1:-0}"
+STAGE_DIR="${2:-}"
+# the file descriptor of the lock on each staged input
+declare -gA STAGE_FDS=()
+
+if [[ -n "$STAGE_DIR" ]] && ! command -v flock > /dev/null; then
+    echo "flock is not available, so inputs will not be staged" >&2
+    STAGE_DIR=""
+fi
+
+# stat -c rather than find -printf, as the predictor containers can have busybox's find,
+# which doesn't have -printf
+function stage_key {
+    local src
+    src=$(realpath "$1")
+    {
+        echo "$src"
+        find -L "$src" -type f -exec stat -L -c '%s %Y %n' {} + | LC_ALL=C sort
+    } | sha1sum | cut -c 1-16
+}
+
+function stage_evict {
+    local max_kb=$((STAGE_MAX_GB * 1024 * 1024))
+    local entry
+    local evicted
+
+    # the cache-wide lock stops two jobs evicting at once
+    exec {evict_fd}> "${STAGE_DIR}/.evict.lock"
+    flock -x "$evict_fd"
+
+    while [[ $(du -sk "$STAGE_DIR" | cut -f1) -gt $max_kb ]]; do
+        evicted=false
+        # least recently used first. an entry is in use if a job has a shared lock on it
+        while read -r entry; do
+            if flock -n -x "${entry}.lock" rm -rf -- "$entry"; then
+                echo "Evicted $entry from the staging cache" >&2
+                evicted=true
+                break
+            fi
+        done < <(find "$STAGE_DIR" -mindepth 1 -maxdepth 1 -type d -name '[0-9a-f]*' \
+            -exec stat -c '%Y %n' {} + | sort -n | cut -d ' ' -f 2-)
+
+        if [ "$evicted" = false ]; then
+            echo "Staging cache is over ${STAGE_MAX_GB}GB, but every entry is in use" >&2
+            break
+        fi
+    done
+
+    exec {evict_fd}>&-
+}
+
+function stage {
+    local src="$1"
+    local var="$2"
+
+    if [[ -z "$STAGE_DIR" ]]; then
+        printf -v "$var" '%s' "$src"
+        return
+    fi
+
+    mkdir -p "$STAGE_DIR"
+    local key
+    key=$(stage_key "$src")
+    local entry="${STAGE_DIR}/${key}"
+    local staged
+    staged="${entry}/$(basename "$src")"
+
+    # held until this job exits. taken before the entry is published, so it can't be
+    # evicted between being published and being used
+    local use_fd
+    exec {use_fd}> "${entry}.lock"
+    flock -s "$use_fd"
+    STAGE_FDS["$src"]="$use_fd"
+
+    # only one job copies an input; any others on the node wait for it to be published
+    local publish_fd
+    exec {publish_fd}> "${entry}.publish.lock"
+    flock -x "$publish_fd"
+    if [[ ! -e "$entry" ]]; then
+        local tmp
+        tmp=$(mktemp -d "${STAGE_DIR}/.tmp.XXXXXX")
+        cp -rL "$src" "${tmp}/"
+        # a rename within the cache, so the entry appears complete or not at all
+        mv "$tmp" "$entry"
+        echo "Staged $src at $staged" >&2
+        exec {publish_fd}>&-
+        stage_evict
+    else
+        exec {publish_fd}>&-
+        # the modification time of an entry is when it was last used
+        touch "$entry"
+        echo "Using staged copy of $src at $staged" >&2
+    fi
+
+    printf -v "$var" '%s' "$staged"
+}
+
+function unstage {
+    local use_fd="${STAGE_FDS["$1"]:-}"
+    if [[ -n "$use_fd" ]]; then
+        exec {use_fd}>&-
+        unset 'STAGE_FDS["$1"]'
+    fi
+}
@@ -0,0 +1,151 @@
+"""Classify reads as their alignments to the decontamination database stream out of the
+mapper and write the reads to keep straight to fastq, along with the stats seqkit stats
+would report for that fastq. The alignments must be grouped by read name, which is the
+order bwa mem and minimap2 write them in.
+"""
+
+import json
+import logging
+import sys
+from collections import Counter
+from itertools import groupby
+from pathlib import Path
+from typing import TextIO
+
+import click
+import pysam
+
+from contamination import Classification, Classifier
+from fastq_stats import FastqStats
+
+
+def write_fastq(record: pysam.AlignedSegment, fp: TextIO) -> bytes:
+    """Write the read in its original orientation and return its raw quality scores"""
+    quals = record.get_forward_qualities()
+    qualstr = pysam.qualities_to_qualitystring(quals)
+    fp.write(f"@{record.query_name}\n{record.get_forward_sequence()}\n+\n{qualstr}\n")
+    return bytes(quals)
+
+
+@click.command()
+@click.help_option("--help", "-h")
+@click.option(
+    "-i",
+    "--samfile",
+    help=(
+        "{B,CR,S}AM file of reads mapped to decontamination database, grouped by read "
+        "name. Reads from stdin by default."
+    ),
+    default="-",
+    show_default=True,
+)
+@click.option(
+    "-m",
+    "--metadata",
+    help=(
+        "TSV file containing information about each reference in the database. Column "
+        "1 is the category, column 2 is whether the reference is contamination, column "
+        "3 is the accession ID for the reference."
+    ),
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+)
+@click.option(
+    "-s",
+    "--stats",
+    help="File to write the seqkit-style stats of the kept reads to.",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+)
+@click.option(
+    "-c",
+    "--counts",
+    help="JSON file to write the number of kept, contaminant, and unmapped reads to",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+)
+@click.option(
+    "-n",
+    "--name",
+    help="Name to give the fastq in the stats file [default: stdout]",
+)
+@click.option(
+    "--ignore-secondary/--include-secondary",
+    help="Ignore organism assignments for secondary alignments?",
+    default=True,
+    show_default=True,
+)
+@click.option(
+    "-@",
+    "--threads",
+    help="Number of threads to use for decompressing BAM/CRAM input.",
+    type=int,
+    default=1,
+    show_default=True,
+)
+@click.option("-v", "--verbose", help="Turns on debug-level logging.", is_flag=True)
+def main(
+    samfile: str,
+    metadata: str,
+    stats: str,
+    counts: str,
+    name: str,
+    ignore_secondary: bool,
+    threads: int,
+    verbose: bool,
+):
+    """Writes the reads to keep to stdout as fastq. A read (pair) is kept if any of its
+    alignments is to a non-contaminant, is a contaminant if any of its alignments is to
+    a contaminant, and is unmapped otherwise.
+    """
+    log_level = logging.DEBUG if verbose else logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s]: %(message)s", level=log_level
+    )
+
+    fq_stats = FastqStats()
+    n_reads = Counter()
+
+    logging.info("Classifying records in alignment stream...")
+    with pysam.AlignmentFile(samfile, threads=threads) as bam:
+        classifier = Classifier(metadata, bam.references)
+        for read_id, group in groupby(bam, key=lambda r: r.query_name):
+            if read_id is None:
+                logging.warning("Got record(s) with no query name. Skipping...")
+                continue
+
+            primaries = []
+            classifications = set()
+            for record in group:
+                if not (record.is_secondary or record.is_supplementary):
+                    primaries.append(record)
+                if record.is_secondary and ignore_secondary:
+                    continue
+                classifications.add(classifier.classify(record))
+
+            if Classification.Keep in classifications:
+                classification = Classification.Keep
+                for record in primaries:
+                    fq_stats.add(write_fastq(record, sys.stdout))
+            elif Classification.Contaminant in classifications:
+                classification = Classification.Contaminant
+            else:
+                classification = Classification.Unmaped
+
+            n_reads[classification] += 1
+
+    logging.info(f"{n_reads[Classification.Keep]} reads are to be kept")
+    logging.info(f"{n_reads[Classification.Contaminant]} reads are contaminants")
+    logging.info(f"{n_reads[Classification.Unmaped]} reads are unmapped")
+
+    fq_stats.write(stats, name or "-")
+    logging.info(f"Stats for kept reads written to {stats}")
+
+    kinds = [Classification.Keep, Classification.Contaminant, Classification.Unmaped]
+    n_reads = {c.value: n_reads[c] for c in kinds}
+    Path(counts).write_text(json.dumps(n_reads, indent=2) + "\n")
+    logging.info(f"Read counts written to {counts}")
+
+
+if __name__ == "__main__":
+    main()
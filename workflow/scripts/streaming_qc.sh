@@ -0,0 +1,132 @@
+#!/usr/bin/env bash
+set -xeo pipefail
+
+DEFAULT_THREADS=1
+IS_ILLUMINA=false
+SCRIPTS=$(dirname "$(realpath "$0")")
+
+function usage {
+    echo "usage: streaming_qc.sh -r <STR> -i <FILE> -d <FILE> -m <FILE> -o <FILE> -s <FILE> -c <FILE> [OPTIONS]"
+    echo "   "
+    echo "  -r                       : Run accession [REQUIRED]"
+    echo "  -i                       : Run info TSV file [REQUIRED]"
+    echo "  -d                       : Database to map to [REQUIRED]"
+    echo "  -m                       : Decontamination database metadata [REQUIRED]"
+    echo "  -o                       : Output (decontaminated) fastq file [REQUIRED]"
+    echo "  -s                       : Output stats file [REQUIRED]"
+    echo "  -c                       : Output read classification counts file [REQUIRED]"
+    echo "  -p                       : Options to pass to fastp/nanoq"
+    echo "  -f                       : Options to pass to streaming_qc.py"
+    echo "  -I                       : Input is Illumina"
+    echo "  -t                       : Number of threads [default: $DEFAULT_THREADS]"
+    echo "  -h | --help              : This message"
+    echo "  Any other options are passed to bwa mem/minimap2"
+}
+
+function parse_args {
+    # positional args
+    args=()
+
+    # named args
+    while [ "$1" != "" ]; do
+        case "$1" in
+            -r)
+                run_acc="$2"
+                shift
+                ;;
+            -i)
+                run_info="$2"
+                shift
+                ;;
+            -d)
+                db="$2"
+                shift
+                ;;
+            -m)
+                metadata="$2"
+                shift
+                ;;
+            -o)
+                output="$2"
+                shift
+                ;;
+            -s)
+                stats="$2"
+                shift
+                ;;
+            -c)
+                counts="$2"
+                shift
+                ;;
+            -p)
+                preprocessing_opts="$2"
+                shift
+                ;;
+            -f)
+                filter_opts="$2"
+                shift
+                ;;
+            -t)
+                threads="$2"
+                shift
+                ;;
+            -I)
+                IS_ILLUMINA=true
+                ;;
+            -h | --help)
+                usage
+                exit
+                ;;             # quit and show usage
+            *) args+=("$1") ;; # if no match, add it to the positional args
+        esac
+        shift # move to next kv pair
+    done
+
+    # validate required args
+    if [[ -z "${run_acc}" || -z "${run_info}" || -z "${db}" || -z "${metadata}" || -z "${output}" || -z "${stats}" || -z "${counts}" ]]; then
+        echo "Invalid arguments"
+        usage
+        exit 1
+    fi
+
+    # set defaults
+    if [[ -z "$threads" ]]; then
+        threads="$DEFAULT_THREADS"
+    fi
+}
+
+function run {
+    parse_args "$@"
+
+    files_str=$(grep "$run_acc" "$run_info" | cut -f2)
+    IFS=';' read -r -a files <<< "$files_str"
+    n_files="${#files[@]}"
+
+    input_arg=("-i ${files[0]}")
+    filter_args=("-m $metadata -s $stats -c $counts -n $output")
+
+    # the reads are never written to disk between steps. the mapper writes each read's
+    # alignments together, so they can be classified as they stream out of it
+    if [ "$IS_ILLUMINA" = true ]; then
+        if [ "$n_files" -eq 2 ]; then
+            input_arg+=("-I ${files[1]}")
+            preprocessing_opts+=" --detect_adapter_for_pe"
+            args+=("-p")
+        fi
+
+        # shellcheck disable=SC2086
+        fastp -w "$threads" ${input_arg[*]} $preprocessing_opts |
+            bwa mem ${args[*]} -t "$threads" "$db" - |
+            python "${SCRIPTS}/streaming_qc.py" ${filter_args[*]} $filter_opts |
+            gzip -c > "$output"
+    else
+        # shellcheck disable=SC2086
+        porechop -t "$threads" ${input_arg[*]} --discard_middle |
+            nanoq $preprocessing_opts |
+            minimap2 ${args[*]} -t "$threads" "$db" - |
+            python "${SCRIPTS}/streaming_qc.py" ${filter_args[*]} $filter_opts |
+            gzip -c > "$output"
+    fi
+}
+
+run "$@"
@@ -25,6 +25,14 @@ ARGS="--contain -B $BINDS"
 SNAKEMAKE_TMP=$(realpath "tmp/snakemake")
 mkdir -p "$SNAKEMAKE_TMP"
 
+# jobs of shadow rules run in a directory under this prefix, so setting it to node-local
+# scratch keeps the predictors' intermediate files off the shared filesystem. snakemake
+# moves the outputs to results/ when a job finishes
+SHADOW_ARGS=()
+if [[ -n "${SHADOW_PREFIX:-}" ]]; then
+  SHADOW_ARGS=(--shadow-prefix "$SHADOW_PREFIX")
+fi
+
 bsub -R "select[mem>$MEMORY] rusage[mem=$MEMORY] span[hosts=1]" \
   -M "$MEMORY" \
   -n "$THREADS" \
@@ -35,6 +43,7 @@ bsub -R "select[mem>$MEMORY] rusage[mem=$MEMORY] span[hosts=1]" \
   --default-resources "tmpdir='$SNAKEMAKE_TMP'" \
   --scheduler greedy \
   --local-cores "$THREADS" \
+  ${SHADOW_ARGS[@]+"${SHADOW_ARGS[@]}"} \
   "$@" --singularity-args "$ARGS"
 
 exit 0
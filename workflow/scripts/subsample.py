@@ -0,0 +1,202 @@
+"""Randomly subsample an (interleaved) fastq to given depths. Mates of a pair are kept
+together. The reads are taken in a random order that depends only on the seed, so the
+reads selected for a lower depth are a subset of those selected for a higher depth.
+
+Subsampling happens in two steps. `select` picks the reads for each depth and writes
+each selection as a gzipped bitmap with a bit for each read (pair), by its position in
+the fastq - set if the read is selected. Bit i is bit i % 8 (least significant first)
+of byte i // 8. `extract` streams the reads of a selection out of the fastq in a single
+pass. Only the standard library is used, so this can run in any of the predictors'
+environments.
+"""
+import argparse
+import gzip
+import logging
+import random
+import sys
+from array import array
+from itertools import groupby
+from typing import Iterator, List, Optional, TextIO
+
+
+def pair_name(header: str) -> str:
+    """Records with the same name, ignoring a /1 or /2 suffix, are a read pair"""
+    name = header[1:].split(maxsplit=1)[0]
+    if name.endswith("/1") or name.endswith("/2"):
+        return name[:-2]
+    return name
+
+
+def fastq_records(path: str) -> Iterator[List[str]]:
+    """The 4 lines of each record in a (4-line) fastq"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as fp:
+        while True:
+            header = fp.readline()
+            if not header:
+                return
+            yield [header, fp.readline(), fp.readline(), fp.readline()]
+
+
+def units(path: str) -> Iterator[List[List[str]]]:
+    """Iterate over the reads of a fastq, with the mates of a pair as a single unit"""
+    for _, group in groupby(fastq_records(path), key=lambda r: pair_name(r[0])):
+        yield list(group)
+
+
+def select(
+    path: str, depths: List[int], genome_size: int, seed: int
+) -> List[bytearray]:
+    """A bitmap of the read (pair)s selected for each depth. Reads are taken in a random
+    order until the number of bases reaches depth * genome_size, or all reads are taken
+    """
+    lengths = array("Q", (sum(len(r[1].rstrip()) for r in u) for u in units(path)))
+    n_units = len(lengths)
+
+    order = array("L", range(n_units))
+    random.Random(seed).shuffle(order)
+
+    bitmaps = []
+    for depth in depths:
+        target = depth * genome_size
+        bits = bytearray((n_units + 7) // 8)
+        n_bases = 0
+        n_kept = 0
+        for i in order:
+            if n_bases >= target:
+                break
+            bits[i >> 3] |= 1 << (i & 7)
+            n_bases += lengths[i]
+            n_kept += 1
+
+        logging.info(
+            f"Selected {n_kept} of {n_units} reads with {n_bases} bases for {depth}x"
+        )
+        bitmaps.append(bits)
+
+    return bitmaps
+
+
+def extract(path: str, bits: bytes, out1: TextIO, out2: Optional[TextIO] = None):
+    """Write the selected reads. If out2 is given, the first and second mates of each
+    pair go to out1 and out2 respectively, otherwise everything goes to out1"""
+    n_selected = sum(bin(byte).count("1") for byte in bits)
+    n_written = 0
+    for i, unit in enumerate(units(path)):
+        if i >> 3 >= len(bits) or not bits[i >> 3] & (1 << (i & 7)):
+            continue
+        if out2 is None:
+            for record in unit:
+                out1.write("".join(record))
+        elif len(unit) == 2:
+            out1.write("".join(unit[0]))
+            out2.write("".join(unit[1]))
+        else:
+            raise ValueError(f"{unit[0][0].strip()} is not paired ({len(unit)} mates)")
+        n_written += 1
+
+    if n_written != n_selected:
+        raise ValueError(
+            f"{n_selected} reads are selected but only {n_written} are in {path}. Was "
+            f"the selection made from a different fastq?"
+        )
+    logging.info(f"Extracted {n_written} reads")
+
+
+def open_output(path: str) -> TextIO:
+    """The extracted reads are only read once, by the predictor, so they are compressed
+    as fast as possible when gzipped"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", compresslevel=1)
+    return open(path, "w")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    select_parser = subparsers.add_parser(
+        "select", help="Select the reads for each depth"
+    )
+    select_parser.add_argument(
+        "-i", "--input", required=True, help="Fastq to subsample (can be gzipped)"
+    )
+    select_parser.add_argument(
+        "-c",
+        "--depths",
+        required=True,
+        type=int,
+        nargs="+",
+        help="Depth(s) to subsample to",
+    )
+    select_parser.add_argument(
+        "-g", "--genome-size", required=True, type=int, help="Size of the genome"
+    )
+    select_parser.add_argument(
+        "-s", "--seed", type=int, default=88, help="Random seed [default: %(default)s]"
+    )
+    select_parser.add_argument(
+        "-o",
+        "--output",
+        required=True,
+        nargs="+",
+        help="File to write the (gzipped) selection bitmap of each depth to",
+    )
+
+    extract_parser = subparsers.add_parser(
+        "extract", help="Write the reads of a selection"
+    )
+    extract_parser.add_argument(
+        "-i", "--input", required=True, help="Fastq the selection was made from"
+    )
+    extract_parser.add_argument(
+        "-b", "--bitmap", required=True, help="Selection bitmap written by select"
+    )
+    extract_parser.add_argument(
+        "-o",
+        "--output",
+        help=(
+            "File to write the subsampled reads to (gzipped if it ends in .gz). If "
+            "--output2 is given, the first mate of each pair [default: stdout]"
+        ),
+    )
+    extract_parser.add_argument(
+        "-O",
+        "--output2",
+        help="Split pairs, writing the second mate of each pair to this file",
+    )
+    args = parser.parse_args()
+
+    log_lvl = logging.DEBUG if args.verbose else logging.INFO
+    logging.basicConfig(
+        format="%(asctime)s [%(levelname)s]: %(message)s", level=log_lvl
+    )
+
+    if args.command == "select":
+        if len(args.depths) != len(args.output):
+            parser.error("select needs an output for each depth")
+
+        bitmaps = select(args.input, args.depths, args.genome_size, args.seed)
+        for bits, path in zip(bitmaps, args.output):
+            with open(path, "wb") as fp:
+                fp.write(gzip.compress(bytes(bits)))
+        return
+
+    with open(args.bitmap, "rb") as fp:
+        bits = gzip.decompress(fp.read())
+
+    out1 = sys.stdout if args.output is None else open_output(args.output)
+    out2 = None if args.output2 is None else open_output(args.output2)
+    try:
+        extract(args.input, bits, out1, out2)
+    finally:
+        for fp in (out1, out2):
+            if fp is not None and fp is not sys.stdout:
+                fp.close()
+
+
+if __name__ == "__main__":
+    main()
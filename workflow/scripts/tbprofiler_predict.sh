@@ -4,8 +4,12 @@ set -euxo pipefail
 # shellcheck disable=SC2154
 exec 2> "${snakemake_log[0]}" # send all stderr from this script to the log file
 
+# stage the reads on node-local scratch (if configured)
+# shellcheck disable=SC1090,SC2086,SC2154
+source ${snakemake_params[stage]}
 # shellcheck disable=SC2154
-reads="${snakemake_input[reads]}"
+stage "${snakemake_input[reads]}" reads
+
 # shellcheck disable=SC2154
 run_acc="${snakemake_wildcards[run]}"
 run_info="${snakemake_input[run_info]}"
@@ -19,9 +23,31 @@ trap 'rm -rf -- "$tmpout"' EXIT
 
 if [ "$n_files" -eq 2 ]; then
     prefix="${tmpout}/${run_acc}"
-    # we need to deinterleave the fastq file
-    seqfu deinterleave -o "$prefix" --check "$reads"
-    input_arg=("-1" "${prefix}_R1.fq" "-2" "${prefix}_R2.fq")
+    r1="${prefix}_R1.fq.gz"
+    r2="${prefix}_R2.fq.gz"
+    # tb-profiler only accepts regular files for its reads, so the mates are split into
+    # a (quickly) gzipped file each in node-local temp space, in a single pass over the
+    # interleaved fastq
+    gzip -dc "$reads" | awk -v r1="gzip -1 > '$r1'" -v r2="gzip -1 > '$r2'" '
+        function pair_name(header,    name) {
+            name = header
+            sub(/[ \t].*/, "", name)
+            sub(/\/[12]$/, "", name)
+            return name
+        }
+        NR % 8 == 1 { name = pair_name($0) }
+        NR % 8 == 5 && pair_name($0) != name {
+            printf "%s and %s are not mates\n", name, $0 > "/dev/stderr"
+            exit 1
+        }
+        { print | ((NR - 1) % 8 < 4 ? r1 : r2) }
+        END {
+            if (close(r1) != 0 || close(r2) != 0) {
+                exit 1
+            }
+        }
+    '
+    input_arg=("-1" "$r1" "-2" "$r2")
 else
     input_arg=("-1" "$reads")
 fi
@@ -35,5 +61,3 @@ fi
 
 # shellcheck disable=SC2154
 tb-profiler profile "${input_arg[@]}" "${opts[@]}" -t "${snakemake[threads]}" -d "${snakemake_params[outdir]}"
-
-rm -rf "$tmpout"
\ No newline at end of file